@@ -0,0 +1,252 @@
+"""ASGI entry point for Splittr.
+
+The I/O-bound JSON and streaming endpoints below run natively on asyncio with an
+async SQLAlchemy engine (aiosqlite for the default SQLite database), so an idle
+or slow connection costs a coroutine instead of a worker thread. Every other
+request is handed to the regular Flask app. Models, the live search cache and the
+search and balance helpers are shared with main.py; the helpers run on the async
+session through AsyncSession.run_sync.
+
+Run with:
+    flask --app main migrate
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from flask_login.utils import decode_cookie
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from main import create_app, db, User, calculate_balances, get_search_session, search_users
+
+# Sync driver -> async driver used when ASYNC_DATABASE_URI isn't configured
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg', 'mysql': 'mysql+aiomysql'}
+
+app = create_app()
+# A pool of threads, so Flask routes run side by side; asgiref's WsgiToAsgi runs every WSGI call on one shared thread
+flask_app = WSGIMiddleware(app, workers=app.config['ASGI_FLASK_THREADS'])
+async_engine = None
+async_session = None
+watcher_task = None
+
+def ensure_started():
+    """Creates the async engine and the ledger watcher on first use (normally at lifespan startup)."""
+    global async_engine, async_session, watcher_task
+    if async_engine is None:
+        async_engine = create_async_engine(async_database_uri())
+        async_session = async_sessionmaker(async_engine, expire_on_commit=False)
+    if watcher_task is None:
+        watcher_task = asyncio.ensure_future(ledger_watcher.run())
+
+def async_database_uri():
+    uri = app.config.get('ASYNC_DATABASE_URI')
+    if uri is None:
+        with app.app_context():
+            url = db.engine.url
+        uri = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    return uri
+
+# --- Authentication ---
+
+def authenticated_user_id(scope):
+    """Reads the Flask-Login user id from the signed session cookie, or from the remember-me cookie."""
+    cookies = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+
+    session_cookie = cookies.get(app.config['SESSION_COOKIE_NAME'])
+    if session_cookie is not None:
+        serializer = app.session_interface.get_signing_serializer(app)
+        try:
+            data = serializer.loads(session_cookie.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            data = {}
+        if data.get('_user_id'):
+            return int(data['_user_id'])
+
+    remember_cookie = cookies.get(app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
+    if remember_cookie is not None:
+        with app.app_context():
+            user_id = decode_cookie(remember_cookie.value)
+        if user_id is not None:
+            return int(user_id)
+    return None
+
+# --- Responses ---
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+# --- Endpoints ---
+
+async def api_search_users(scope, receive, send, user_id):
+    query = parse_qs(scope['query_string'].decode()).get('q', [''])[0]
+    if len(query) < 2:
+        return await send_json(send, [])
+
+    search_session = get_search_session(user_id)
+    if not search_session.allow_search():
+        return await send_json(send, {'error': 'Too many searches. Slow down a little.'}, 429, [(b'retry-after', b'1')])
+
+    # The session only connects on a cache miss
+    async with async_session() as session:
+        matches = await session.run_sync(lambda sync_session: search_users(user_id, query, sync_session.execute))
+    await send_json(send, matches)
+
+async def api_balances(scope, receive, send, user_id):
+    async with async_session() as session:
+        balances = await session.run_sync(lambda sync_session: calculate_balances(user_id, sync_session.execute))
+    await send_json(send, [
+        {'id': friend.id, 'name': friend.name, 'username': friend.username, 'balance_cents': cents}
+        for friend, cents in balances.items()
+    ])
+
+class LedgerWatcher:
+    """Tells open /api/updates streams when their user's ledger_version changes.
+
+    A single background task polls the versions of every subscribed user in one
+    query per tick, so the database load doesn't grow with the number of streams.
+    """
+    def __init__(self):
+        self.subscribers = {}
+        self.versions = {}
+
+    async def subscribe(self, user_id):
+        """Returns (queue, version): the queue receives every version after the current one, which is returned.
+
+        The version is read after the queue is registered, so a write between connecting and the next poll is
+        compared against it instead of becoming the first baseline the poller sees.
+        """
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            async with async_session() as session:
+                version = (await session.execute(select(User.ledger_version).where(User.id == user_id))).scalar_one()
+        except BaseException:
+            self.unsubscribe(user_id, queue)
+            raise
+        self.versions.setdefault(user_id, version)
+        return queue, version
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+                self.versions.pop(user_id, None)
+
+    def publish(self, user_id, version):
+        for queue in self.subscribers.get(user_id, ()):
+            # Only the newest version matters to a client, so replace anything it hasn't read yet
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(version)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(app.config['LIVE_UPDATES_POLL_SECONDS'])
+            if not self.subscribers:
+                continue
+            try:
+                async with async_session() as session:
+                    rows = (await session.execute(
+                        select(User.id, User.ledger_version).where(User.id.in_(list(self.subscribers)))
+                    )).all()
+            except Exception:
+                app.logger.exception('Ledger watcher poll failed')
+                continue
+            for user_id, version in rows:
+                previous = self.versions.get(user_id)
+                self.versions[user_id] = version
+                if previous is not None and previous != version:
+                    self.publish(user_id, version)
+
+ledger_watcher = LedgerWatcher()
+
+async def api_updates(scope, receive, send, user_id):
+    """Server-sent events stream emitting a 'ledger' event whenever the user's dashboard data changes.
+
+    The first event carries the current version, so a client can tell whether the page it rendered is already stale.
+    """
+    queue, version = await ledger_watcher.subscribe(user_id)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')],
+        })
+        await send({'type': 'http.response.body', 'body': ledger_event(version), 'more_body': True})
+        while True:
+            next_version = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({next_version, disconnected}, timeout=app.config['LIVE_UPDATES_KEEPALIVE_SECONDS'],
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_version.cancel()
+                break
+            if next_version in done:
+                chunk = ledger_event(next_version.result())
+            else:
+                next_version.cancel()
+                chunk = b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        ledger_watcher.unsubscribe(user_id, queue)
+
+def ledger_event(version):
+    return f"event: ledger\ndata: {json.dumps({'version': version})}\n\n".encode()
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+ASYNC_ROUTES = {
+    '/api/search_users': api_search_users,
+    '/api/balances': api_balances,
+    '/api/updates': api_updates,
+}
+
+# --- ASGI Application ---
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            ensure_started()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if watcher_task is not None:
+                watcher_task.cancel()
+            if async_engine is not None:
+                await async_engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    handler = ASYNC_ROUTES.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+    if handler is None:
+        return await flask_app(scope, receive, send)
+
+    user_id = authenticated_user_id(scope)
+    if user_id is None:
+        return await send_json(send, {'error': 'Login required.'}, 401)
+    ensure_started()
+    # App contexts live in contextvars, so each request task gets its own
+    with app.app_context():
+        await handler(scope, receive, send, user_id)
@@ -0,0 +1,27 @@
+// Fades [data-aos] elements in once, as they scroll into view. Covers the part of AOS the landing page used:
+// the fade-up/fade-down effects (styled in app.css) and data-aos-delay.
+(function () {
+    var elements = document.querySelectorAll('[data-aos]');
+    function reveal(element) {
+        element.classList.add('aos-animate');
+    }
+    if (!('IntersectionObserver' in window)) {
+        elements.forEach(reveal);
+        return;
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                reveal(entry.target);
+                observer.unobserve(entry.target);
+            }
+        });
+    }, { rootMargin: '0px 0px -120px 0px' });
+    elements.forEach(function (element) {
+        var delay = element.getAttribute('data-aos-delay');
+        if (delay) {
+            element.style.transitionDelay = delay + 'ms';
+        }
+        observer.observe(element);
+    });
+})();
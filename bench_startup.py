@@ -0,0 +1,95 @@
+"""Cold-start benchmark for Splittr.
+
+Every run starts a fresh interpreter, so import costs aren't hidden by module
+caches. It measures:
+- import time of main
+- create_app() time
+- time to the first rendered response (the schema migration runs separately and is reported apart)
+- RSS after a short warmup
+
+Prints one JSON object with the median of each metric, suitable for appending to
+a per-release log:
+
+    python bench_startup.py --runs 5 >> bench_output.txt
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r'''
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+imported = time.perf_counter()
+app = main.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + sys.argv[2], 'SECRET_KEY': 'bench'})
+created = time.perf_counter()
+with app.app_context():
+    main.migrate_schema()
+migrated = time.perf_counter()
+client = app.test_client()
+first_start = time.perf_counter()
+assert client.get('/').status_code == 200
+first_done = time.perf_counter()
+for _ in range(int(sys.argv[3])):
+    client.get('/')
+    client.get('/login')
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'migrate_ms': (migrated - created) * 1000,
+    'time_to_first_response_ms': ((created - start) + (first_done - first_start)) * 1000,
+    'rss_mb': rss_mb(),
+}))
+'''
+
+def run_once(warmup):
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, HERE, os.path.join(tmp, 'bench.db'), str(warmup)],
+            check=True, capture_output=True, text=True, cwd=tmp
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_wall_ms'] = (time.perf_counter() - started) * 1000
+        return result
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to start (default: 5)')
+    parser.add_argument('--warmup', type=int, default=50, help='request pairs served before measuring RSS (default: 50)')
+    args = parser.parse_args()
+
+    runs = [run_once(args.warmup) for _ in range(args.runs)]
+    summary = {key: round(statistics.median(run[key] for run in runs), 2) for key in runs[0]}
+    summary.update(revision=git_revision(), runs=args.runs, python=sys.version.split()[0])
+    print(json.dumps(summary))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Builds Splittr's static assets.
+
+Replaces the runtime Tailwind CDN script and the third-party font/AOS links with
+self-hosted files:
+- Tailwind CSS compiled ahead of time, keeping only the classes that appear in
+  the templates in main.py (assets/src/app.css)
+- reveal.js, the landing page's scroll animations (assets/src/reveal.js)
+- the Inter font, committed as a Latin subset (assets/src/fonts/, see its README)
+
+Nothing is downloaded at build time. The Tailwind CLI comes from the
+tailwindcss-bin wheel, installed with pinned hashes:
+
+    pip install --require-hashes --only-binary :all: -r requirements-assets.txt
+    python build_assets.py
+
+Every output is fingerprinted (name.<hash>.ext) into static/dist/ together with
+.gz (and .br, when the brotli module is installed) siblings and a manifest.json
+mapping logical names to fingerprinted ones. The app serves them from /assets/
+with far-future immutable caching, and templates refer to them through
+asset_url('app.css').
+
+The CLI is looked up in $TAILWINDCSS_BIN, then on PATH.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(HERE, 'assets', 'src')
+DIST_DIR = os.path.join(HERE, 'static', 'dist')
+
+# Major version assets/src/app.css is written for; requirements-assets.txt pins the exact release
+TAILWIND_MAJOR = 4
+# Logical names copied from assets/src/ as they are; app.css may refer to them with relative url()s
+STATIC_SOURCES = ('reveal.js', 'fonts/InterVariable-latin.woff2')
+
+# Already-compressed formats aren't worth a .gz/.br sibling
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+
+def tailwind_binary():
+    binary = os.environ.get('TAILWINDCSS_BIN') or shutil.which('tailwindcss')
+    if binary is None:
+        sys.exit('Tailwind CLI not found: pip install --require-hashes --only-binary :all: -r requirements-assets.txt, '
+                 'or set TAILWINDCSS_BIN')
+    version = subprocess.run([binary, '--help'], capture_output=True, text=True).stdout
+    match = re.search(r'v(\d+)\.\d+\.\d+', version)
+    if match and int(match.group(1)) != TAILWIND_MAJOR:
+        sys.exit(f'Tailwind CLI {match.group(0)} found; assets/src/app.css targets v{TAILWIND_MAJOR}')
+    return binary
+
+def compile_css():
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'app.css')
+        # Sources to scan for class names are declared with @source in app.css
+        subprocess.run([tailwind_binary(), '--input', os.path.join(SOURCE_DIR, 'app.css'), '--output', output, '--minify'],
+                       cwd=HERE, check=True)
+        with open(output, 'rb') as f:
+            return f.read()
+
+def rewrite_urls(css, manifest):
+    """Points url() references to other build outputs at their fingerprinted names."""
+    def replace(match):
+        return b'url(' + manifest.get(match.group(2).decode(), match.group(2).decode()).encode() + b')'
+    return re.sub(rb"""url\((['"]?)([^'")]+)\1\)""", replace, css)
+
+def fingerprinted(name, data):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+def write_output(name, data, manifest):
+    manifest[name] = fingerprinted(name, data)
+    path = os.path.join(DIST_DIR, manifest[name])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if name.endswith(COMPRESSIBLE):
+        # mtime=0 keeps the .gz byte-identical across builds of the same input
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        try:
+            import brotli
+        except ImportError:
+            return
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+def main():
+    css = compile_css()
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+    for name in STATIC_SOURCES:
+        with open(os.path.join(SOURCE_DIR, name), 'rb') as f:
+            write_output(name, f.read(), manifest)
+    # Written last, so its own fingerprint changes whenever a file it refers to does
+    write_output('app.css', rewrite_urls(css, manifest), manifest)
+
+    with open(os.path.join(DIST_DIR, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    for name, path in sorted(manifest.items()):
+        size = os.path.getsize(os.path.join(DIST_DIR, path))
+        print(f'{path:48} {size / 1024:8.1f} KiB')
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,86 @@
+import calendar
+import click
+import csv
+import hashlib
+import io
+import json
 import os
-from flask import Flask, request, redirect, url_for, flash, get_flashed_messages, jsonify
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from flask import (Flask, Blueprint, current_app, request, redirect, url_for, flash, get_flashed_messages, jsonify, session,
+                   make_response, abort, send_file, stream_with_context)
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import or_, and_, not_
+from werkzeug.utils import safe_join
+from sqlalchemy import or_, and_, not_, func, case, cast, select, union, insert, update, inspect, text, bindparam, Integer
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.schema import CreateColumn
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from itertools import groupby
 from jinja2 import Environment, DictLoader
 
-# --- App Initialization ---
-app = Flask(__name__)
-
 # --- Configuration ---
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a_very_secret_key_for_prod')
-# Database file name changed to reflect new schema
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///splittr_app_v2.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'a_very_secret_key_for_prod')
+    # Database file name changed to reflect new schema (v3: money stored as integer cents)
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///splittr_app_v3.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # How long a stored idempotent response can be replayed for a retried POST, and how long a duplicate
+    # waits for the original request to finish before getting a 409
+    IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+    IDEMPOTENCY_WAIT_SECONDS = 2
+    # How many times a write is re-run after losing an optimistic version check
+    OPTIMISTIC_RETRY_ATTEMPTS = 3
+    # Live user search: cached session lifetime, candidate list cap and per-user token bucket
+    SEARCH_CACHE_TTL = 30
+    SEARCH_CACHE_MAX_CANDIDATES = 500
+    SEARCH_CACHE_MAX_SESSIONS = 10000
+    SEARCH_RATE_BURST = 10
+    SEARCH_RATE_PER_SECOND = 4
+    # Number of rendered dashboard fragments kept in memory per worker
+    DASHBOARD_CACHE_SIZE = 2048
+    # asgi.py: seconds between ledger_version polls for open /api/updates streams, and between keepalives
+    LIVE_UPDATES_POLL_SECONDS = 2
+    LIVE_UPDATES_KEEPALIVE_SECONDS = 25
+    # asgi.py: threads running Flask routes, i.e. how many regular page requests are served at once
+    ASGI_FLASK_THREADS = 16
+    # Recurring expenses: templates per scheduler transaction, periods caught up per template per batch, tick length
+    RECURRING_BATCH_SIZE = 500
+    RECURRING_MAX_CATCHUP = 120
+    RECURRING_TICK_SECONDS = 60
+    # How far in the past a new template's first charge may be
+    RECURRING_MAX_BACKDATE_DAYS = 31
+    # Groups: expenses listed on a group page, and rows fetched per round trip by the CSV export
+    GROUP_RECENT_EXPENSES = 20
+    GROUP_EXPORT_BATCH_SIZE = 1000
+    # Output of build_assets.py: fingerprinted, precompressed files plus manifest.json
+    ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'dist')
+    ASSETS_MAX_AGE = 365 * 24 * 3600
 
 # --- Database and Login Manager Setup ---
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+# Bound to an app in create_app(); nothing connects to the database at import time.
+db = SQLAlchemy()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
 
+bp = Blueprint('main', __name__)
+
 # --- Database Models ---
 
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class Friendship(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user1_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -34,6 +92,8 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=True) # This is the Venmo username
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
+    # Bumped by every write that can change this user's dashboard; keys the dashboard cache and ETag
+    ledger_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -50,25 +110,743 @@ class FriendRequest(db.Model):
 class Expense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
+    total_cents = db.Column(db.Integer, nullable=False)
     payer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=True, default=utcnow) # NULL for expenses logged before timestamps existed
+    recurring_id = db.Column(db.Integer, db.ForeignKey('recurring_expense.id'), nullable=True)
+    period_at = db.Column(db.DateTime, nullable=True) # the recurring period this expense materializes
+    group_id = db.Column(db.Integer, db.ForeignKey('expense_group.id'), nullable=True, index=True) # NULL for pairwise expenses
     payer = db.relationship('User', backref='paid_expenses')
+    group = db.relationship('Group')
     debts = db.relationship('Debt', backref='expense', cascade="all, delete-orphan")
 
+    # A period can only ever be materialized once, even if two schedulers race
+    __table_args__ = (db.Index('uq_expense_recurring_period', 'recurring_id', 'period_at', unique=True),)
+
 class Debt(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=False)
     debtor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
-    paid_amount = db.Column(db.Float, default=0.0)
+    amount_cents = db.Column(db.Integer, nullable=False)
+    paid_cents = db.Column(db.Integer, nullable=False, default=0)
     is_fully_paid = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     debtor = db.relationship('User', foreign_keys=[debtor_id])
 
+    # Every UPDATE checks the version it read; a concurrent writer makes the flush raise StaleDataError.
+    __mapper_args__ = {'version_id_col': version}
+
+class RecurringExpense(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    payer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    total_cents = db.Column(db.Integer, nullable=False)
+    split_method = db.Column(db.String(10), nullable=False, default='even')
+    cadence = db.Column(db.String(10), nullable=False) # a key of CADENCES
+    starts_at = db.Column(db.DateTime, nullable=False)
+    run_count = db.Column(db.Integer, nullable=False, default=0) # periods materialized so far
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    participants = db.relationship('RecurringParticipant', cascade="all, delete-orphan", lazy='selectin')
+
+    __table_args__ = (db.Index('ix_recurring_expense_due', 'active', 'next_run_at'),)
+
+class RecurringParticipant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recurring_id = db.Column(db.Integer, db.ForeignKey('recurring_expense.id'), nullable=False, index=True)
+    debtor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False) # split once when the template is created
+    debtor = db.relationship('User')
+
+class Settlement(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    payer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # the friend paying back
+    payee_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    group_id = db.Column(db.Integer, db.ForeignKey('expense_group.id'), nullable=True) # set by a group settle-all
+
+class Group(db.Model):
+    """A trip or household. Its expenses are settled inside the group instead of pairwise."""
+    __tablename__ = 'expense_group' # GROUP is a reserved word in SQL
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    # Running totals, so a summary never scans the group's expenses
+    total_cents = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    expense_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    settled_at = db.Column(db.DateTime, nullable=True) # last settle-all
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    # Every expense and settle-all updates this row, so the version check serializes writes to one group.
+    __mapper_args__ = {'version_id_col': version}
+
+class GroupMember(db.Model):
+    """A member's position in a group, updated in the same transaction as every group expense and settlement.
+
+    net_cents is positive when the rest of the group owes the member; the nets of a group always sum to zero.
+    """
+    group_id = db.Column(db.Integer, db.ForeignKey('expense_group.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    joined_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    paid_cents = db.Column(db.Integer, nullable=False, default=0) # group expenses the member paid for
+    share_cents = db.Column(db.Integer, nullable=False, default=0) # the member's shares, including of what they paid
+    net_cents = db.Column(db.Integer, nullable=False, default=0) # paid - share + settlements paid - settlements received
+    user = db.relationship('User')
+
+    __table_args__ = (db.Index('ix_group_member_user', 'user_id'),)
+
+GROUP_POSITION_COLUMNS = ('paid_cents', 'share_cents', 'net_cents')
+
+class SpendingRollup(db.Model):
+    """Monthly totals between a user and one friend, from the user's side; updated on every write.
+
+    month is YYYYMM, or 0 for history recorded before timestamps existed.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    friend_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    paid_cents = db.Column(db.Integer, nullable=False, default=0) # friend's shares of expenses the user paid
+    owed_cents = db.Column(db.Integer, nullable=False, default=0) # user's shares of expenses the friend paid
+    settled_in_cents = db.Column(db.Integer, nullable=False, default=0) # repayments the friend made to the user
+    settled_out_cents = db.Column(db.Integer, nullable=False, default=0) # repayments the user made to the friend
+
+ROLLUP_COLUMNS = ('paid_cents', 'owed_cents', 'settled_in_cents', 'settled_out_cents')
+
+class IdempotencyKey(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    endpoint = db.Column(db.String(80), nullable=False)
+    path = db.Column(db.String(500), nullable=False, server_default='') # with view args, e.g. /settle/2
+    response_status = db.Column(db.Integer, nullable=True) # NULL while the first request is still running
+    response_location = db.Column(db.String(500), nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    __table_args__ = (db.UniqueConstraint('user_id', 'key'),)
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# --- HTML Templates ---
+# --- Shared Queries ---
+# Statement builders used by both the Flask routes (db.session) and the async endpoints in asgi.py.
+
+def friend_ids_stmt(user_id):
+    other = case((Friendship.user1_id == user_id, Friendship.user2_id), else_=Friendship.user1_id)
+    return select(other).where(or_(Friendship.user1_id == user_id, Friendship.user2_id == user_id)).order_by(Friendship.id)
+
+def search_exclusions_stmt(user_id):
+    """Ids of everyone user_id is already friends with or has a pending request with."""
+    requested = case((FriendRequest.sender_id == user_id, FriendRequest.receiver_id), else_=FriendRequest.sender_id)
+    return union(
+        friend_ids_stmt(user_id).order_by(None),
+        select(requested).where(or_(FriendRequest.sender_id == user_id, FriendRequest.receiver_id == user_id))
+    )
+
+def like_escape(text):
+    """Escapes LIKE wildcards so text matches literally, as the in-memory substring check in SearchSession.refine does."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def user_search_stmt(query, exclude_ids):
+    # One row past the cache cap tells SearchSession.remember that the list is incomplete
+    return select(User.id, User.username, User.name).where(
+        User.username.ilike(f'%{like_escape(query)}%', escape='\\'),
+        not_(User.id.in_(exclude_ids))
+    ).order_by(User.id).limit(current_app.config['SEARCH_CACHE_MAX_CANDIDATES'] + 1)
+
+def ledger_balances_stmt(user_id, friend_ids):
+    """Nets both directions of debt between user_id and each friend in one grouped aggregate.
+
+    Debts from group expenses are settled through their group, so they are left out.
+    """
+    i_paid = Expense.payer_id == user_id
+    counterpart = case((i_paid, Debt.debtor_id), else_=Expense.payer_id)
+    outstanding = Debt.amount_cents - Debt.paid_cents
+    return select(counterpart, func.sum(case((i_paid, outstanding), else_=-outstanding))).select_from(Debt).join(Expense).where(
+        Expense.group_id.is_(None),
+        or_(
+            and_(i_paid, Debt.debtor_id.in_(friend_ids)),
+            and_(Debt.debtor_id == user_id, Expense.payer_id.in_(friend_ids))
+        )
+    ).group_by(counterpart)
+
+def rollup_totals_stmt(user_id, start_month, end_month):
+    """Per-friend sums over a month range; reads at most one rollup row per friend per month."""
+    return select(SpendingRollup.friend_id, *(func.sum(getattr(SpendingRollup, c)).label(c) for c in ROLLUP_COLUMNS)).where(
+        SpendingRollup.user_id == user_id,
+        SpendingRollup.month.between(start_month, end_month)
+    ).group_by(SpendingRollup.friend_id)
+
+def rollup_months_stmt(user_id, friend_id, start_month, end_month):
+    return select(SpendingRollup.month, *(getattr(SpendingRollup, c) for c in ROLLUP_COLUMNS)).where(
+        SpendingRollup.user_id == user_id,
+        SpendingRollup.friend_id == friend_id,
+        SpendingRollup.month.between(start_month, end_month)
+    ).order_by(SpendingRollup.month)
+
+def group_positions_stmt(group_id):
+    """Everything a group page shows about its members: one row per member."""
+    return select(GroupMember.user_id, User.name, User.username, *(getattr(GroupMember, c) for c in GROUP_POSITION_COLUMNS)).join(
+        User, User.id == GroupMember.user_id
+    ).where(GroupMember.group_id == group_id).order_by(User.name, User.id)
+
+def user_groups_stmt(user_id):
+    return select(Group.id, Group.name, GroupMember.net_cents).join(GroupMember, GroupMember.group_id == Group.id).where(
+        GroupMember.user_id == user_id
+    ).order_by(Group.name, Group.id)
+
+# --- Money Helpers ---
+# All amounts are stored and summed as integer cents; floats never touch the ledger.
+
+# Largest amount a form may enter ($10 billion), so sums of many amounts stay well inside a 64-bit column
+MAX_AMOUNT_CENTS = 10 ** 12
+
+class InvalidSplit(Exception):
+    """Raised by to_cents and parse_split with a message that can be flashed to the user as-is."""
+
+def to_cents(value):
+    """Parses a user-entered dollar string (e.g. '12.5') into integer cents."""
+    try:
+        amount = Decimal(value.strip())
+        # copy_abs() and comparisons never round, so exponents like 1e999999 can't overflow before they're rejected
+        if not amount.is_finite() or amount.copy_abs() > Decimal(MAX_AMOUNT_CENTS).scaleb(-2):
+            raise InvalidSplit('Invalid amount.')
+        return int((amount * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise InvalidSplit('Invalid amount.') from None
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+def allocate_cents(total_cents, weights):
+    """Splits total_cents proportionally to weights using the largest-remainder method.
+
+    The shares always sum exactly to total_cents; leftover cents go to the largest
+    fractional remainders, ties broken by position.
+    """
+    weight_sum = sum(weights)
+    shares = [total_cents * w // weight_sum for w in weights]
+    remainders = sorted(range(len(weights)), key=lambda i: (-(total_cents * weights[i] % weight_sum), i))
+    for i in remainders[:total_cents - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+def parse_split(form, total_cents):
+    """Returns {friend_id: cents} owed by each friend selected in an expense form.
+
+    to_cents only parses; this is where a total must be positive and no share may be negative.
+    """
+    if total_cents <= 0:
+        raise InvalidSplit('The total must be more than zero.')
+    friend_ids = form.getlist('friend_ids')
+    if not friend_ids:
+        raise InvalidSplit('You must select at least one friend to split with.')
+
+    if form.get('split_method', 'even') == 'even':
+        # Share 0 is the payer's own portion and never becomes a debt.
+        shares = allocate_cents(total_cents, [1] * (len(friend_ids) + 1))[1:]
+        return {int(friend_id): share for friend_id, share in zip(friend_ids, shares)}
+
+    custom_cents = {}
+    for friend_id in friend_ids:
+        amount_str = form.get(f'custom_amount_{friend_id}')
+        if amount_str:
+            custom_cents[int(friend_id)] = to_cents(amount_str)
+    if any(cents < 0 for cents in custom_cents.values()):
+        raise InvalidSplit('Custom amounts cannot be negative.')
+    if sum(custom_cents.values()) > total_cents:
+        raise InvalidSplit('Custom amounts cannot add up to more than the total bill.')
+    return custom_cents
+
+# --- Write Safety Helpers ---
+
+def commit_with_retry(operation):
+    """Runs operation() and commits, re-running it from a fresh transaction when a version check fails.
+
+    Raises StaleDataError once OPTIMISTIC_RETRY_ATTEMPTS is exhausted.
+    """
+    attempts = current_app.config['OPTIMISTIC_RETRY_ATTEMPTS']
+    for attempt in range(attempts):
+        try:
+            result = operation()
+            db.session.commit()
+            return result
+        except StaleDataError:
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+
+def replay_response(record):
+    response = current_app.response_class(record.response_body, status=record.response_status)
+    if record.response_location:
+        response.headers['Location'] = record.response_location
+    return response
+
+def idempotent(view):
+    """Makes a POST route safe to retry when the client sends an idempotency key.
+
+    The key is claimed before the view runs, so a concurrent duplicate either waits
+    briefly for the original response or gets a 409; a later duplicate replays the
+    stored response until the key expires. A key sent with a different path than
+    the one it was claimed for gets a 422 instead of someone else's response.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        if request.method != 'POST' or not key:
+            return view(*args, **kwargs)
+        key = key[:64]
+
+        now = utcnow()
+        IdempotencyKey.query.filter(IdempotencyKey.expires_at < now).delete()
+        record = IdempotencyKey(user_id=current_user.id, key=key, endpoint=request.endpoint, path=request.path,
+                                expires_at=now + current_app.config['IDEMPOTENCY_KEY_TTL'])
+        db.session.add(record)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+            while True:
+                existing = IdempotencyKey.query.filter_by(user_id=current_user.id, key=key).first()
+                if existing is None:
+                    break
+                if existing.path != request.path:
+                    return 'This idempotency key was already used for a different request.', 422
+                if existing.response_status is not None:
+                    return replay_response(existing)
+                db.session.rollback()
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.2)
+            return 'This request is already being processed.', 409
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=record.id).delete()
+            db.session.commit()
+            raise
+        record.response_status = response.status_code
+        record.response_location = response.headers.get('Location')
+        record.response_body = response.get_data(as_text=True)
+        db.session.commit()
+        return response
+    return wrapper
+
+# --- Live Search Cache ---
+# Sessions live in process memory, so each worker keeps its own; SEARCH_CACHE_TTL bounds staleness.
+
+def app_cache(name):
+    """Returns the current app's (OrderedDict, lock) pair called name, so separate apps never share cached data."""
+    return current_app.extensions.setdefault(name, (OrderedDict(), threading.Lock()))
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class SearchSession:
+    """A user's live-search state: their exclusion set and every candidate matching the last query.
+
+    While the user keeps typing, a query that contains the previous one can only
+    match a subset of its candidates, so it is answered by filtering in memory.
+    """
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.bucket = TokenBucket(current_app.config['SEARCH_RATE_BURST'], current_app.config['SEARCH_RATE_PER_SECOND'])
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        self.generation += 1
+        self.exclude_ids = None
+        self.query = None
+        self.candidates = None # None when the last query matched too many users to keep
+        self.loaded_at = 0.0
+
+    def allow_search(self):
+        """Takes a token from the rate limiter; the lock keeps concurrent requests from spending the same token."""
+        with self.lock:
+            return self.bucket.take()
+
+    def refine(self, query, limit=10):
+        """Answers query from memory, or returns None when the database has to be asked."""
+        needle = query.lower()
+        with self.lock:
+            if time.monotonic() - self.loaded_at > current_app.config['SEARCH_CACHE_TTL']:
+                self.reset()
+                return None
+            if self.candidates is None or self.query not in needle:
+                return None
+            self.candidates = [c for c in self.candidates if needle in c['username'].lower()]
+            self.query = needle
+            return self.candidates[:limit]
+
+    def snapshot(self):
+        """Returns (generation, exclude_ids); exclude_ids is None when they must be reloaded."""
+        with self.lock:
+            return self.generation, self.exclude_ids
+
+    def remember(self, generation, query, exclude_ids, rows, limit=10):
+        """Caches a database answer unless the session was invalidated while it was being fetched."""
+        matches = [{'id': r.id, 'username': r.username, 'name': r.name} for r in rows]
+        with self.lock:
+            if generation == self.generation:
+                if self.exclude_ids is None:
+                    self.exclude_ids = exclude_ids
+                    self.loaded_at = time.monotonic()
+                cap = current_app.config['SEARCH_CACHE_MAX_CANDIDATES']
+                self.candidates = matches if len(matches) <= cap else None
+                self.query = query.lower()
+        return matches[:limit]
+
+def search_users(user_id, query, execute=None):
+    """Answers query from the user's search session, asking the database through execute on a miss.
+
+    execute defaults to db.session.execute; asgi.py passes a Session's execute inside AsyncSession.run_sync.
+    """
+    execute = execute or db.session.execute
+    session = get_search_session(user_id)
+    matches = session.refine(query)
+    if matches is None:
+        generation, exclude_ids = session.snapshot()
+        if exclude_ids is None:
+            exclude_ids = {user_id, *execute(search_exclusions_stmt(user_id)).scalars()}
+        rows = execute(user_search_stmt(query, exclude_ids)).all()
+        matches = session.remember(generation, query, exclude_ids, rows)
+    return matches
+
+def get_search_session(user_id):
+    search_sessions, search_sessions_lock = app_cache('splittr_search_sessions')
+    with search_sessions_lock:
+        session = search_sessions.get(user_id)
+        if session is None:
+            session = search_sessions[user_id] = SearchSession(user_id)
+            if len(search_sessions) > current_app.config['SEARCH_CACHE_MAX_SESSIONS']:
+                search_sessions.popitem(last=False)
+        search_sessions.move_to_end(user_id)
+        return session
+
+def invalidate_search_sessions(*user_ids):
+    search_sessions, search_sessions_lock = app_cache('splittr_search_sessions')
+    with search_sessions_lock:
+        sessions = [search_sessions[uid] for uid in user_ids if uid in search_sessions]
+    for session in sessions:
+        with session.lock:
+            session.reset()
+
+# --- Dashboard Cache ---
+
+def bump_ledger_versions(*user_ids):
+    """Invalidates the cached dashboards of user_ids; call inside the write's transaction."""
+    User.query.filter(User.id.in_(user_ids)).update(
+        {User.ledger_version: User.ledger_version + 1}, synchronize_session=False)
+
+def get_dashboard_fragment(key):
+    dashboard_fragments, dashboard_fragments_lock = app_cache('splittr_dashboard_fragments')
+    with dashboard_fragments_lock:
+        fragment = dashboard_fragments.get(key)
+        if fragment is not None:
+            dashboard_fragments.move_to_end(key)
+        return fragment
+
+def put_dashboard_fragment(key, fragment):
+    dashboard_fragments, dashboard_fragments_lock = app_cache('splittr_dashboard_fragments')
+    with dashboard_fragments_lock:
+        dashboard_fragments[key] = fragment
+        while len(dashboard_fragments) > current_app.config['DASHBOARD_CACHE_SIZE']:
+            dashboard_fragments.popitem(last=False)
+
+# --- Spending Rollups ---
+
+ROLLUP_UPSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+def month_key(moment):
+    return moment.year * 100 + moment.month
+
+def parse_month(value):
+    """Parses 'YYYY-MM' into a YYYYMM month key."""
+    year, month = value.split('-')
+    if not 1 <= int(month) <= 12:
+        raise ValueError(f'Invalid month: {value}')
+    return int(year) * 100 + int(month)
+
+def format_month(month):
+    return 'Undated' if month == 0 else f'{month // 100:04d}-{month % 100:02d}'
+
+def new_rollup_deltas():
+    """An empty {(user_id, friend_id, month): {column: cents}} map for the add_*_deltas helpers."""
+    return defaultdict(lambda: dict.fromkeys(ROLLUP_COLUMNS, 0))
+
+def add_expense_deltas(deltas, payer_id, month, shares):
+    """Records an expense's (debtor_id, cents) shares from both sides."""
+    for debtor_id, cents in shares:
+        deltas[(payer_id, debtor_id, month)]['paid_cents'] += cents
+        deltas[(debtor_id, payer_id, month)]['owed_cents'] += cents
+
+def add_settlement_deltas(deltas, payer_id, payee_id, month, cents):
+    deltas[(payee_id, payer_id, month)]['settled_in_cents'] += cents
+    deltas[(payer_id, payee_id, month)]['settled_out_cents'] += cents
+
+def bump_rollups(deltas):
+    """Adds deltas to the rollups with one executemany of atomic upserts.
+
+    Call inside the write's transaction so the rollups commit or roll back with it.
+    """
+    if not deltas:
+        return
+    stmt = ROLLUP_UPSERTS[db.session.get_bind().dialect.name](SpendingRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'friend_id', 'month'],
+        set_={c: getattr(SpendingRollup, c) + stmt.excluded[c] for c in ROLLUP_COLUMNS}
+    )
+    db.session.execute(stmt, [
+        {'user_id': user_id, 'friend_id': friend_id, 'month': month, **values}
+        for (user_id, friend_id, month), values in deltas.items()
+    ])
+
+def month_key_expr(column):
+    """SQL for the YYYYMM key of a datetime column, 0 when it is NULL."""
+    if db.engine.dialect.name == 'postgresql':
+        key = func.to_char(column, 'YYYYMM')
+    else:
+        key = func.strftime('%Y%m', column)
+    return func.coalesce(cast(key, Integer), 0)
+
+def backfill_rollups():
+    """Rebuilds every rollup row from Expense, Debt and Settlement with grouped queries.
+
+    Pairwise repayments recorded before Settlement rows existed only survive as Debt.paid_cents,
+    so the part not covered by settlements lands in the undated (0) month.
+    """
+    totals = new_rollup_deltas()
+    expense_month = month_key_expr(Expense.created_at)
+    for payer_id, debtor_id, month, cents in db.session.execute(
+        select(Expense.payer_id, Debt.debtor_id, expense_month, func.sum(Debt.amount_cents))
+        .select_from(Debt).join(Expense).group_by(Expense.payer_id, Debt.debtor_id, expense_month)
+    ):
+        add_expense_deltas(totals, payer_id, month, [(debtor_id, int(cents))])
+
+    settlement_month = month_key_expr(Settlement.created_at)
+    settled = {}
+    in_group = Settlement.group_id.isnot(None)
+    for payer_id, payee_id, group_settlement, month, cents in db.session.execute(
+        select(Settlement.payer_id, Settlement.payee_id, in_group, settlement_month, func.sum(Settlement.amount_cents))
+        .group_by(Settlement.payer_id, Settlement.payee_id, in_group, settlement_month)
+    ):
+        add_settlement_deltas(totals, payer_id, payee_id, month, int(cents))
+        # Group settlements never touch Debt.paid_cents
+        if not group_settlement:
+            settled[(payer_id, payee_id)] = settled.get((payer_id, payee_id), 0) + int(cents)
+
+    for payee_id, payer_id, repaid in db.session.execute(
+        select(Expense.payer_id, Debt.debtor_id, func.sum(Debt.paid_cents))
+        .select_from(Debt).join(Expense).group_by(Expense.payer_id, Debt.debtor_id)
+    ):
+        undated = int(repaid or 0) - settled.get((payer_id, payee_id), 0)
+        if undated > 0:
+            add_settlement_deltas(totals, payer_id, payee_id, 0, undated)
+
+    SpendingRollup.query.delete()
+    if totals:
+        db.session.execute(SpendingRollup.__table__.insert(), [
+            {'user_id': user_id, 'friend_id': friend_id, 'month': month, **row}
+            for (user_id, friend_id, month), row in totals.items()
+        ])
+    db.session.commit()
+    return len(totals)
+
+# --- Recurring Expenses ---
+
+def add_months(moment, months):
+    """Shifts moment by whole months, clamping the day to the target month's length."""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+# Period n of a template is always computed from starts_at, so month-end clamping never drifts
+CADENCES = {
+    'weekly': lambda start, n: start + timedelta(weeks=n),
+    'monthly': add_months,
+}
+
+def recurring_period_at(template, n):
+    return CADENCES[template.cadence](template.starts_at, n)
+
+def materialize_recurring_batch(templates, now):
+    """Bulk-inserts the Expense and Debt rows for every due period of templates; returns the expense count.
+
+    Runs inside the caller's transaction together with the template advances, rollups
+    and ledger versions, so a batch is either fully materialized or not at all.
+    """
+    max_catchup = current_app.config['RECURRING_MAX_CATCHUP']
+    expense_rows, expense_templates, template_updates = [], [], []
+    for template in templates:
+        n = template.run_count
+        while n - template.run_count < max_catchup and (period_at := recurring_period_at(template, n)) <= now:
+            expense_rows.append({'description': template.description, 'total_cents': template.total_cents,
+                                 'payer_id': template.payer_id, 'created_at': period_at,
+                                 'recurring_id': template.id, 'period_at': period_at})
+            expense_templates.append(template)
+            n += 1
+        template_updates.append({'id': template.id, 'run_count': n, 'next_run_at': recurring_period_at(template, n)})
+
+    if expense_rows:
+        expense_ids = db.session.scalars(insert(Expense).returning(Expense.id, sort_by_parameter_order=True), expense_rows).all()
+        debt_rows, deltas, touched_users = [], new_rollup_deltas(), set()
+        for expense_id, row, template in zip(expense_ids, expense_rows, expense_templates):
+            shares = [(p.debtor_id, p.amount_cents) for p in template.participants]
+            debt_rows.extend({'expense_id': expense_id, 'debtor_id': debtor_id, 'amount_cents': cents,
+                              'paid_cents': 0, 'is_fully_paid': False, 'version': 1} for debtor_id, cents in shares)
+            add_expense_deltas(deltas, template.payer_id, month_key(row['period_at']), shares)
+            touched_users.update([template.payer_id, *(debtor_id for debtor_id, _ in shares)])
+        if debt_rows:
+            db.session.execute(Debt.__table__.insert(), debt_rows)
+        bump_rollups(deltas)
+        bump_ledger_versions(*touched_users)
+    db.session.execute(update(RecurringExpense), template_updates)
+    return len(expense_rows)
+
+def materialize_due_recurring(now=None):
+    """One scheduler tick: materializes every due period of every active template.
+
+    Due templates come from a single indexed query per batch of RECURRING_BATCH_SIZE,
+    and each batch commits in one transaction. Periods missed while the scheduler was
+    down are caught up in order. The unique (recurring_id, period_at) index keeps a
+    concurrent scheduler from creating duplicates: the losing batch rolls back and
+    the tick ends.
+    """
+    now = now or utcnow()
+    created = 0
+    while True:
+        templates = RecurringExpense.query.filter(
+            RecurringExpense.active == True,
+            RecurringExpense.next_run_at <= now
+        ).order_by(RecurringExpense.next_run_at).limit(current_app.config['RECURRING_BATCH_SIZE']).all()
+        if not templates:
+            return created
+        try:
+            created += materialize_recurring_batch(templates, now)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return created
+
+# --- Groups ---
+
+def new_position_deltas():
+    """An empty {user_id: {column: cents}} map of changes to one group's member positions."""
+    return defaultdict(lambda: dict.fromkeys(GROUP_POSITION_COLUMNS, 0))
+
+def add_group_expense_deltas(deltas, payer_id, total_cents, shares):
+    """Records a group expense; shares are the (debtor_id, cents) of the members other than the payer."""
+    payer_share = total_cents - sum(cents for _, cents in shares)
+    deltas[payer_id]['paid_cents'] += total_cents
+    deltas[payer_id]['share_cents'] += payer_share
+    deltas[payer_id]['net_cents'] += total_cents - payer_share
+    for debtor_id, cents in shares:
+        deltas[debtor_id]['share_cents'] += cents
+        deltas[debtor_id]['net_cents'] -= cents
+
+def add_group_settlement_deltas(deltas, payer_id, payee_id, cents):
+    deltas[payer_id]['net_cents'] += cents
+    deltas[payee_id]['net_cents'] -= cents
+
+def bump_group_positions(group_id, deltas):
+    """Adds deltas to the members' positions with one executemany of in-place increments.
+
+    Call inside the write's transaction, next to the Group row update that guards it.
+    """
+    if not deltas:
+        return
+    table = GroupMember.__table__
+    stmt = update(table).where(
+        table.c.group_id == bindparam('b_group_id'),
+        table.c.user_id == bindparam('b_user_id')
+    ).values({c: table.c[c] + bindparam(f'b_{c}') for c in GROUP_POSITION_COLUMNS})
+    db.session.execute(stmt, [
+        {'b_group_id': group_id, 'b_user_id': user_id, **{f'b_{c}': cents for c, cents in values.items()}}
+        for user_id, values in deltas.items()
+    ])
+
+def settle_up_transfers(positions):
+    """Returns (payer_id, payee_id, cents) payments that bring every (user_id, net_cents) position to zero.
+
+    The largest debtor pays the largest creditor first, so N members never need more than N-1 payments.
+    """
+    positions = list(positions)
+    debtors = sorted(([-net, user_id] for user_id, net in positions if net < 0), reverse=True)
+    creditors = sorted(([net, user_id] for user_id, net in positions if net > 0), reverse=True)
+    transfers = []
+    i = j = 0
+    while i < len(debtors) and j < len(creditors):
+        cents = min(debtors[i][0], creditors[j][0])
+        transfers.append((debtors[i][1], creditors[j][1], cents))
+        debtors[i][0] -= cents
+        creditors[j][0] -= cents
+        if debtors[i][0] == 0:
+            i += 1
+        if creditors[j][0] == 0:
+            j += 1
+    return transfers
+
+def csv_cell(value):
+    """Keeps spreadsheet apps from evaluating user-entered text that looks like a formula."""
+    value = str(value)
+    return "'" + value if value.startswith(('=', '+', '-', '@')) else value
+
+# --- Static Assets ---
+# Precompressed siblings written by build_assets.py, in order of preference
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+ASSET_TYPES = {'.css': 'text/css', '.js': 'text/javascript', '.woff2': 'font/woff2', '.svg': 'image/svg+xml'}
+
+def load_asset_manifest(app):
+    """Reads manifest.json into the app once at startup. A checkout without a build still serves every page, unstyled,
+    and says how to fix it once rather than failing each request."""
+    path = os.path.join(app.config['ASSETS_DIR'], 'manifest.json')
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        app.logger.warning('%s not found; pages are served without CSS/JS until you run `python build_assets.py`', path)
+        app.extensions['splittr_assets'] = ({}, 'unbuilt')
+        return
+    app.extensions['splittr_assets'] = (json.loads(raw), hashlib.sha1(raw).hexdigest()[:12])
+
+def get_asset_manifest():
+    """Returns (manifest, version) for the built assets; the manifest is empty when they haven't been built."""
+    return current_app.extensions['splittr_assets']
+
+def forget_session_access(response):
+    """Keeps asset responses free of Vary: Cookie (added whenever a hook such as Flask-Login's reads the
+    session), so shared caches store one copy per asset rather than one per visitor."""
+    if request.endpoint == 'main.asset':
+        session.accessed = False
+    return response
+
+def asset_url(name):
+    """URL of the fingerprinted build of a logical asset name such as 'app.css', or None before the first build."""
+    filename = get_asset_manifest()[0].get(name)
+    return url_for('main.asset', filename=filename) if filename else None
+
+
 HOME_PAGE_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="en">
@@ -76,26 +854,10 @@ HOME_PAGE_TEMPLATE = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Splittr - Effortless Expense Sharing</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;700;900&display=swap" rel="stylesheet">
-    <!-- AOS Animation Library CSS -->
-    <link href="https://unpkg.com/aos@2.3.1/dist/aos.css" rel="stylesheet">
-    <style>
-        body { 
-            font-family: 'Inter', sans-serif; 
-            background-color: #020617; /* slate-950 */
-        }
-        .gradient-text {
-            background-image: linear-gradient(to right, #818cf8, #38bdf8);
-            -webkit-background-clip: text;
-            background-clip: text;
-            color: transparent;
-        }
-    </style>
+    {% with href = asset_url('fonts/InterVariable-latin.woff2') %}{% if href %}<link rel="preload" href="{{ href }}" as="font" type="font/woff2" crossorigin>{% endif %}{% endwith %}
+    {% with href = asset_url('app.css') %}{% if href %}<link href="{{ href }}" rel="stylesheet">{% endif %}{% endwith %}
 </head>
-<body class="text-slate-200">
+<body class="bg-slate-950 text-slate-200">
 
     <!-- Header -->
     <header class="absolute top-0 left-0 w-full z-10 py-6 px-4">
@@ -109,9 +871,9 @@ HOME_PAGE_TEMPLATE = """
 
     <!-- Hero Section -->
     <main class="relative isolate overflow-hidden">
-        <div class="absolute inset-0 bg-slate-900/50 backdrop-blur-sm z-0"></div>
+        <div class="absolute inset-0 bg-slate-900/50 backdrop-blur-xs z-0"></div>
         <div class="absolute -top-48 left-1/2 -z-10 -translate-x-1/2 transform-gpu blur-3xl" aria-hidden="true">
-            <div class="aspect-[1108/632] w-[69.25rem] bg-gradient-to-r from-[#80caff] to-[#4f46e5] opacity-20" style="clip-path: polygon(73.6% 51.7%, 91.7% 11.8%, 100% 46.4%, 97.4% 82.2%, 92.5% 84.9%, 75.7% 64.3%, 55.3% 47.5%, 46.5% 49.4%, 45% 62.9%, 50.3% 87.2%, 21.3% 64.1%, 0.1% 100%, 1.4% 98.3%, 17.4% 92.5%, 27.5% 78.7%, 76.5% 97.2%, 73.6% 51.7%)"></div>
+            <div class="aspect-[1108/632] w-[69.25rem] bg-linear-to-r from-[#80caff] to-[#4f46e5] opacity-20" style="clip-path: polygon(73.6% 51.7%, 91.7% 11.8%, 100% 46.4%, 97.4% 82.2%, 92.5% 84.9%, 75.7% 64.3%, 55.3% 47.5%, 46.5% 49.4%, 45% 62.9%, 50.3% 87.2%, 21.3% 64.1%, 0.1% 100%, 1.4% 98.3%, 17.4% 92.5%, 27.5% 78.7%, 76.5% 97.2%, 73.6% 51.7%)"></div>
         </div>
         <div class="mx-auto max-w-6xl px-6 lg:px-8 py-32 sm:py-48 lg:py-56 text-center relative z-10">
             <h1 class="text-4xl font-black tracking-tight text-white sm:text-6xl" data-aos="fade-down">
@@ -219,14 +981,8 @@ HOME_PAGE_TEMPLATE = """
         </div>
     </footer>
 
-    <!-- AOS Animation Library JS -->
-    <script src="https://unpkg.com/aos@2.3.1/dist/aos.js"></script>
-    <script>
-      AOS.init({
-        duration: 800, // Animation duration
-        once: true,    // Whether animation should happen only once
-      });
-    </script>
+    <!-- Scroll-reveal for the data-aos elements -->
+    {% with src = asset_url('reveal.js') %}{% if src %}<script src="{{ src }}"></script>{% endif %}{% endwith %}
 
 </body>
 </html>
@@ -240,11 +996,8 @@ LAYOUT_TEMPLATE = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Splittr</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;700&display=swap" rel="stylesheet">
-    <style> body { font-family: 'Inter', sans-serif; } </style>
+    {% with href = asset_url('fonts/InterVariable-latin.woff2') %}{% if href %}<link rel="preload" href="{{ href }}" as="font" type="font/woff2" crossorigin>{% endif %}{% endwith %}
+    {% with href = asset_url('app.css') %}{% if href %}<link href="{{ href }}" rel="stylesheet">{% endif %}{% endwith %}
 </head>
 <body class="bg-slate-900 text-white">
     <div class="container mx-auto px-4 py-8 max-w-4xl">
@@ -267,7 +1020,7 @@ LOGIN_TEMPLATE = """
 {% extends "layout.html" %}
 {% block content %}
 <div class="max-w-md mx-auto mt-10 bg-slate-800 p-8 rounded-lg shadow-lg">
-    <h1 class="text-3xl font-bold text-center text-transparent bg-clip-text bg-gradient-to-r from-indigo-400 to-cyan-400 mb-6">
+    <h1 class="text-3xl font-bold text-center text-transparent bg-clip-text bg-linear-to-r from-indigo-400 to-cyan-400 mb-6">
         {% if form_type == 'login' %}Welcome to Splittr{% else %}Join Splittr{% endif %}
     </h1>
     <form method="POST" class="space-y-4">
@@ -295,7 +1048,7 @@ LOGIN_TEMPLATE = """
         </button>
     </form>
     <div class="text-center mt-4">
-        <a href="{{ url_for('register') if form_type == 'login' else url_for('login') }}" class="text-cyan-400 hover:text-cyan-300">
+        <a href="{{ url_for('main.register') if form_type == 'login' else url_for('main.login') }}" class="text-cyan-400 hover:text-cyan-300">
             {% if form_type == 'login' %}Need an account? Sign Up{% else %}Already have an account? Login{% endif %}
         </a>
     </div>
@@ -305,25 +1058,32 @@ LOGIN_TEMPLATE = """
 
 DASHBOARD_TEMPLATE = """
 {% extends "layout.html" %}
-{% block content %}
+{% block content %}{{ fragment|safe }}{% endblock %}
+"""
+
+# Rendered once per (user, ledger_version) and cached; must not depend on per-request state like flashes
+DASHBOARD_FRAGMENT_TEMPLATE = """
 <header class="flex justify-between items-center mb-6">
     <div>
-        <h1 class="text-3xl sm:text-4xl font-bold text-transparent bg-clip-text bg-gradient-to-r from-indigo-400 to-cyan-400">
+        <h1 class="text-3xl sm:text-4xl font-bold text-transparent bg-clip-text bg-linear-to-r from-indigo-400 to-cyan-400">
             Splittr
         </h1>
         <p class="text-slate-400">Welcome, {{ current_user.name }}!</p>
     </div>
-    <a href="{{ url_for('logout') }}" class="bg-red-800/50 hover:bg-red-700/50 text-red-300 p-2 rounded-lg">Logout</a>
+    <a href="{{ url_for('main.logout') }}" class="bg-red-800/50 hover:bg-red-700/50 text-red-300 p-2 rounded-lg">Logout</a>
 </header>
 <nav class="flex justify-center items-center gap-4 my-6">
-    <a href="{{ url_for('dashboard') }}" class="px-4 py-2 rounded-lg font-semibold bg-indigo-600 text-white">Dashboard</a>
-    <a href="{{ url_for('friends') }}" class="relative px-4 py-2 rounded-lg font-semibold bg-slate-700 text-slate-300 hover:bg-slate-600">
+    <a href="{{ url_for('main.dashboard') }}" class="px-4 py-2 rounded-lg font-semibold bg-indigo-600 text-white">Dashboard</a>
+    <a href="{{ url_for('main.friends') }}" class="relative px-4 py-2 rounded-lg font-semibold bg-slate-700 text-slate-300 hover:bg-slate-600">
         Friends
         {% if request_count > 0 %}
         <span class="absolute -top-2 -right-2 bg-red-500 text-white text-xs rounded-full h-5 w-5 flex items-center justify-center">{{ request_count }}</span>
         {% endif %}
     </a>
-    <a href="{{ url_for('add_expense') }}" class="px-4 py-2 rounded-lg font-semibold bg-cyan-600 hover:bg-cyan-500 text-white">Add Expense</a>
+    <a href="{{ url_for('main.groups') }}" class="px-4 py-2 rounded-lg font-semibold bg-slate-700 text-slate-300 hover:bg-slate-600">Groups</a>
+    <a href="{{ url_for('main.recurring') }}" class="px-4 py-2 rounded-lg font-semibold bg-slate-700 text-slate-300 hover:bg-slate-600">Recurring</a>
+    <a href="{{ url_for('main.analytics') }}" class="px-4 py-2 rounded-lg font-semibold bg-slate-700 text-slate-300 hover:bg-slate-600">Analytics</a>
+    <a href="{{ url_for('main.add_expense') }}" class="px-4 py-2 rounded-lg font-semibold bg-cyan-600 hover:bg-cyan-500 text-white">Add Expense</a>
 </nav>
 <main>
     <h2 class="text-2xl font-bold mb-4">Your Balances</h2>
@@ -336,19 +1096,19 @@ DASHBOARD_TEMPLATE = """
                     {% if friend.username %}
                     <p class="text-sm text-cyan-400">@{{ friend.username }}</p>
                     {% endif %}
-                    <p class="mt-1 font-semibold {% if balance > 0.005 %}text-green-400{% elif balance < -0.005 %}text-red-400{% else %}text-slate-400{% endif %}">
-                        {% if balance > 0.005 %}
-                            Owes you ${{ "%.2f"|format(balance) }}
-                        {% elif balance < -0.005 %}
-                            You owe ${{ "%.2f"|format(balance|abs) }}
+                    <p class="mt-1 font-semibold {% if balance > 0 %}text-green-400{% elif balance < 0 %}text-red-400{% else %}text-slate-400{% endif %}">
+                        {% if balance > 0 %}
+                            Owes you ${{ balance|money }}
+                        {% elif balance < 0 %}
+                            You owe ${{ balance|abs|money }}
                         {% else %}
                             All settled up
                         {% endif %}
                     </p>
                 </div>
                 <div>
-                {% if balance > 0.005 %}
-                    <a href="{{ url_for('settle', friend_id=friend.id) }}" class="bg-green-600 hover:bg-green-500 text-white font-bold py-2 px-4 rounded-lg">Settle Up</a>
+                {% if balance > 0 %}
+                    <a href="{{ url_for('main.settle', friend_id=friend.id) }}" class="bg-green-600 hover:bg-green-500 text-white font-bold py-2 px-4 rounded-lg">Settle Up</a>
                 {% endif %}
                 </div>
             </div>
@@ -359,16 +1119,28 @@ DASHBOARD_TEMPLATE = """
             <p class="text-slate-400">No balances to show. Add an expense or make some friends!</p>
         </div>
     {% endif %}
+    {% if groups %}
+    <h2 class="text-2xl font-bold mt-8 mb-4">Your Groups</h2>
+    <div class="space-y-3">
+    {% for g in groups %}
+        <a href="{{ url_for('main.group_detail', group_id=g.id) }}" class="bg-slate-800 hover:bg-slate-700 p-4 rounded-lg shadow-md flex justify-between items-center gap-4">
+            <h3 class="text-xl font-bold">{{ g.name }}</h3>
+            <p class="font-semibold {% if g.net_cents > 0 %}text-green-400{% elif g.net_cents < 0 %}text-red-400{% else %}text-slate-400{% endif %}">
+                {% if g.net_cents > 0 %}The group owes you ${{ g.net_cents|money }}{% elif g.net_cents < 0 %}You owe ${{ g.net_cents|abs|money }}{% else %}All settled up{% endif %}
+            </p>
+        </a>
+    {% endfor %}
+    </div>
+    {% endif %}
 </main>
-{% endblock %}
 """
 
 FRIENDS_TEMPLATE = """
 {% extends "layout.html" %}
 {% block content %}
 <header class="flex justify-between items-center mb-6">
-    <h1 class="text-3xl font-bold text-transparent bg-clip-text bg-gradient-to-r from-indigo-400 to-cyan-400">Manage Friends</h1>
-    <a href="{{ url_for('dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
+    <h1 class="text-3xl font-bold text-transparent bg-clip-text bg-linear-to-r from-indigo-400 to-cyan-400">Manage Friends</h1>
+    <a href="{{ url_for('main.dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
 </header>
 <div class="grid md:grid-cols-2 gap-6">
     <div>
@@ -398,8 +1170,8 @@ FRIENDS_TEMPLATE = """
             <div class="flex justify-between items-center bg-slate-700/50 p-3 rounded-md">
                 <span>{{ req.sender.name }} sent you a request.</span>
                 <div class="flex gap-2">
-                    <a href="{{ url_for('handle_request', request_id=req.id, action='accept') }}" class="bg-green-600 hover:bg-green-500 p-2 rounded-lg">Accept</a>
-                    <a href="{{ url_for('handle_request', request_id=req.id, action='decline') }}" class="bg-red-600 hover:bg-red-500 p-2 rounded-lg">Decline</a>
+                    <a href="{{ url_for('main.handle_request', request_id=req.id, action='accept') }}" class="bg-green-600 hover:bg-green-500 p-2 rounded-lg">Accept</a>
+                    <a href="{{ url_for('main.handle_request', request_id=req.id, action='decline') }}" class="bg-red-600 hover:bg-red-500 p-2 rounded-lg">Decline</a>
                 </div>
             </div>
             {% else %}
@@ -420,9 +1192,10 @@ FRIENDS_TEMPLATE = """
             return;
         }
         searchTimeout = setTimeout(() => {
-            fetch(`/api/search_users?q=${query}`)
-                .then(response => response.json())
+            fetch(`/api/search_users?q=${encodeURIComponent(query)}`)
+                .then(response => response.status === 429 ? null : response.json())
                 .then(data => {
+                    if (data === null) return; // rate limited; the next keystroke retries
                     resultsContainer.innerHTML = '';
                     if (data.length > 0) {
                         data.forEach(user => {
@@ -452,10 +1225,11 @@ ADD_EXPENSE_TEMPLATE = """
 {% block content %}
 <div class="max-w-lg mx-auto bg-slate-800 p-8 rounded-lg shadow-lg">
     <div class="flex justify-between items-center mb-6">
-      <h2 class="text-2xl font-bold">Log a New Expense</h2>
-      <a href="{{ url_for('dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
+      <h2 class="text-2xl font-bold">{% if recurring %}New Recurring Expense{% elif group %}Add to {{ group.name }}{% else %}Log a New Expense{% endif %}</h2>
+      <a href="{{ url_for('main.recurring') if recurring else url_for('main.group_detail', group_id=group.id) if group else url_for('main.dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back</a>
     </div>
     <form method="POST" class="space-y-6">
+        <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
         <div>
             <label for="description" class="block mb-2 text-sm font-medium text-slate-300">Description</label>
             <input type="text" name="description" class="w-full bg-slate-700 text-white p-3 rounded-lg border border-slate-600" required>
@@ -464,16 +1238,31 @@ ADD_EXPENSE_TEMPLATE = """
             <label for="amount" class="block mb-2 text-sm font-medium text-slate-300">Total Amount You Paid</label>
             <input type="number" name="total_amount" id="total_amount" min="0.01" step="0.01" class="w-full bg-slate-700 text-white p-3 rounded-lg border border-slate-600" required>
         </div>
+        {% if recurring %}
+        <div class="grid grid-cols-2 gap-4">
+            <div>
+                <label for="cadence" class="block mb-2 text-sm font-medium text-slate-300">Repeats</label>
+                <select name="cadence" class="w-full bg-slate-700 text-white p-3 rounded-lg border border-slate-600">
+                    <option value="monthly">Monthly</option>
+                    <option value="weekly">Weekly</option>
+                </select>
+            </div>
+            <div>
+                <label for="starts_on" class="block mb-2 text-sm font-medium text-slate-300">First Charge</label>
+                <input type="date" name="starts_on" value="{{ today }}" class="w-full bg-slate-700 text-white p-3 rounded-lg border border-slate-600" required>
+            </div>
+        </div>
+        {% endif %}
         <div>
             <label class="block mb-2 text-sm font-medium text-slate-300">Split With</label>
             <div class="max-h-40 overflow-y-auto space-y-2 p-3 bg-slate-900/50 rounded-lg border border-slate-700">
                 {% for friend in friends %}
                 <label class="flex items-center gap-3 p-2 rounded-md hover:bg-slate-700/50 cursor-pointer">
-                    <input type="checkbox" name="friend_ids" value="{{ friend.id }}" class="friend-checkbox w-5 h-5 bg-slate-600 border-slate-500 rounded text-cyan-500 focus:ring-cyan-600">
+                    <input type="checkbox" name="friend_ids" value="{{ friend.id }}" class="friend-checkbox w-5 h-5 bg-slate-600 border-slate-500 rounded-sm text-cyan-500 focus:ring-cyan-600">
                     <span>{{ friend.name }}</span>
                 </label>
                 {% else %}
-                <p class="text-slate-400 text-center">You need to add friends first.</p>
+                <p class="text-slate-400 text-center">{% if group %}Add members to the group first.{% else %}You need to add friends first.{% endif %}</p>
                 {% endfor %}
             </div>
         </div>
@@ -487,7 +1276,7 @@ ADD_EXPENSE_TEMPLATE = """
         <div id="custom-amounts-section" class="hidden space-y-3 pt-4 border-t border-slate-700">
              <p class="text-sm text-slate-400">Enter what each person owes. The remainder is your share. Must add up to the total.</p>
         </div>
-        <button type="submit" class="w-full bg-cyan-600 hover:bg-cyan-500 text-white font-bold py-3 px-4 rounded-lg">Add Expense</button>
+        <button type="submit" class="w-full bg-cyan-600 hover:bg-cyan-500 text-white font-bold py-3 px-4 rounded-lg">{% if recurring %}Create Recurring Expense{% else %}Add Expense{% endif %}</button>
     </form>
 </div>
 <script>
@@ -539,16 +1328,17 @@ SETTLE_TEMPLATE = """
 <div class="max-w-md mx-auto bg-slate-800 p-8 rounded-lg shadow-lg">
     <div class="flex justify-between items-center mb-6">
       <h2 class="text-2xl font-bold">Settle with {{ friend.name }}</h2>
-      <a href="{{ url_for('dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
+      <a href="{{ url_for('main.dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
     </div>
     <div class="mb-4 p-3 bg-green-900/50 border border-green-500/30 rounded-lg">
         <p class="text-slate-300">Current amount they owe you:</p>
-        <p class="text-2xl font-bold text-green-400">${{ "%.2f"|format(balance) }}</p>
+        <p class="text-2xl font-bold text-green-400">${{ balance|money }}</p>
     </div>
     <form method="POST" class="space-y-4">
+        <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
         <div>
             <label for="amount" class="block mb-2 text-sm font-medium text-slate-300">Payment Amount Received</label>
-            <input type="number" name="amount" value="{{ "%.2f"|format(balance) }}" min="0.01" max="{{ "%.2f"|format(balance) }}" step="0.01" class="w-full bg-slate-700 text-white p-3 rounded-lg border border-slate-600" required>
+            <input type="number" name="amount" value="{{ balance|money }}" min="0.01" max="{{ balance|money }}" step="0.01" class="w-full bg-slate-700 text-white p-3 rounded-lg border border-slate-600" required>
         </div>
         <button type="submit" class="w-full bg-green-600 hover:bg-green-500 text-white font-bold py-3 px-4 rounded-lg">Record Payment</button>
     </form>
@@ -562,16 +1352,16 @@ PAST_EXPENSES_TEMPLATE = """
 <div class="max-w-2xl mx-auto">
     <div class="flex justify-between items-center mb-6">
         <h2 class="text-2xl font-bold">Past Expenses</h2>
-        <a href="{{ url_for('dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
+        <a href="{{ url_for('main.dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
     </div>
     <div class="mb-8">
         <h3 class="text-xl font-semibold mb-2">Expenses You Paid</h3>
         {% if paid_expenses %}
             <ul class="space-y-3">
                 {% for exp in paid_expenses %}
-                <li class="bg-slate-800 p-4 rounded-lg shadow flex flex-col">
+                <li class="bg-slate-800 p-4 rounded-lg shadow-sm flex flex-col">
                     <span class="font-bold">{{ exp.description }}</span>
-                    <span class="text-slate-400 text-sm">Total: ${{ "%.2f"|format(exp.total_amount) }}</span>
+                    <span class="text-slate-400 text-sm">Total: ${{ exp.total_cents|money }}{% if exp.group %} in {{ exp.group.name }}{% endif %}</span>
                     <span class="text-slate-400 text-sm">Split with: 
                         {% for d in exp.debts %}
                             {{ d.debtor.name }}{% if not loop.last %}, {% endif %}
@@ -589,11 +1379,15 @@ PAST_EXPENSES_TEMPLATE = """
         {% if owed_expenses %}
             <ul class="space-y-3">
                 {% for d in owed_expenses %}
-                <li class="bg-slate-800 p-4 rounded-lg shadow flex flex-col">
+                <li class="bg-slate-800 p-4 rounded-lg shadow-sm flex flex-col">
                     <span class="font-bold">{{ d.expense.description }}</span>
                     <span class="text-slate-400 text-sm">Paid by: {{ d.expense.payer.name }}</span>
-                    <span class="text-slate-400 text-sm">Your Share: ${{ "%.2f"|format(d.amount) }}</span>
-                    <span class="text-slate-400 text-sm">Paid: ${{ "%.2f"|format(d.paid_amount) }} | Owed: ${{ "%.2f"|format(d.amount - d.paid_amount) }}</span>
+                    <span class="text-slate-400 text-sm">Your Share: ${{ d.amount_cents|money }}</span>
+                    {% if d.expense.group %}
+                    <span class="text-slate-400 text-sm">Settled through {{ d.expense.group.name }}</span>
+                    {% else %}
+                    <span class="text-slate-400 text-sm">Paid: ${{ d.paid_cents|money }} | Owed: ${{ (d.amount_cents - d.paid_cents)|money }}</span>
+                    {% endif %}
                 </li>
                 {% endfor %}
             </ul>
@@ -605,41 +1399,277 @@ PAST_EXPENSES_TEMPLATE = """
 {% endblock %}
 """
 
+RECURRING_TEMPLATE = """
+{% extends "layout.html" %}
+{% block content %}
+<div class="max-w-2xl mx-auto">
+    <div class="flex justify-between items-center mb-6">
+        <h2 class="text-2xl font-bold">Recurring Expenses</h2>
+        <a href="{{ url_for('main.dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
+    </div>
+    <a href="{{ url_for('main.new_recurring') }}" class="inline-block mb-6 bg-cyan-600 hover:bg-cyan-500 text-white font-bold py-2 px-4 rounded-lg">New Recurring Expense</a>
+    {% if templates %}
+        <ul class="space-y-3">
+            {% for t in templates %}
+            <li class="bg-slate-800 p-4 rounded-lg shadow-sm flex justify-between items-center gap-4">
+                <div class="flex flex-col">
+                    <span class="font-bold">{{ t.description }}</span>
+                    <span class="text-slate-400 text-sm">${{ t.total_cents|money }} {{ t.cadence }}, split with
+                        {% for p in t.participants %}{{ p.debtor.name }}{% if not loop.last %}, {% endif %}{% endfor %}
+                    </span>
+                    <span class="text-slate-400 text-sm">{% if t.active %}Next charge: {{ t.next_run_at.strftime('%Y-%m-%d') }}{% else %}Stopped{% endif %}</span>
+                </div>
+                {% if t.active %}
+                <form method="POST" action="{{ url_for('main.stop_recurring', recurring_id=t.id) }}">
+                    <button type="submit" class="bg-red-800/50 hover:bg-red-700/50 text-red-300 p-2 rounded-lg">Stop</button>
+                </form>
+                {% endif %}
+            </li>
+            {% endfor %}
+        </ul>
+    {% else %}
+        <p class="text-slate-400">No recurring expenses yet. Set up rent or a subscription once and it will be logged for you.</p>
+    {% endif %}
+</div>
+{% endblock %}
+"""
+
+ANALYTICS_TEMPLATE = """
+{% extends "layout.html" %}
+{% block content %}
+<div class="max-w-3xl mx-auto">
+    <div class="flex justify-between items-center mb-6">
+        <h2 class="text-2xl font-bold">Spending in {{ year }}</h2>
+        <a href="{{ url_for('main.dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
+    </div>
+    <div class="flex justify-between mb-4">
+        <a href="{{ url_for('main.analytics', year=year - 1) }}" class="text-cyan-400 hover:text-cyan-300">&larr; {{ year - 1 }}</a>
+        <a href="{{ url_for('main.analytics', year=year + 1) }}" class="text-cyan-400 hover:text-cyan-300">{{ year + 1 }} &rarr;</a>
+    </div>
+    {% if friend_totals %}
+    <div class="bg-slate-800 p-4 rounded-lg shadow-md mb-8 overflow-x-auto">
+        <table class="w-full text-sm text-left">
+            <thead class="text-slate-400">
+                <tr><th class="p-2">Friend</th><th class="p-2">You covered</th><th class="p-2">They covered</th><th class="p-2">They repaid</th><th class="p-2">You repaid</th></tr>
+            </thead>
+            <tbody>
+            {% for friend_row, t in friend_totals %}
+                <tr class="border-t border-slate-700">
+                    <td class="p-2"><a href="{{ url_for('main.analytics', year=year, friend_id=friend_row.id) }}" class="text-cyan-400 hover:text-cyan-300">{{ friend_row.name }}</a></td>
+                    <td class="p-2">${{ t.paid_cents|money }}</td>
+                    <td class="p-2">${{ t.owed_cents|money }}</td>
+                    <td class="p-2">${{ t.settled_in_cents|money }}</td>
+                    <td class="p-2">${{ t.settled_out_cents|money }}</td>
+                </tr>
+            {% endfor %}
+            </tbody>
+        </table>
+    </div>
+    {% else %}
+        <p class="text-slate-400 mb-8">No shared spending in {{ year }}.</p>
+    {% endif %}
+    {% if friend %}
+    <h3 class="text-xl font-semibold mb-2">Month by month with {{ friend.name }}</h3>
+    <div class="bg-slate-800 p-4 rounded-lg shadow-md overflow-x-auto">
+        <table class="w-full text-sm text-left">
+            <thead class="text-slate-400">
+                <tr><th class="p-2">Month</th><th class="p-2">You covered</th><th class="p-2">They covered</th><th class="p-2">They repaid</th><th class="p-2">You repaid</th></tr>
+            </thead>
+            <tbody>
+            {% for m in months %}
+                <tr class="border-t border-slate-700">
+                    <td class="p-2">{{ m.month|month_label }}</td>
+                    <td class="p-2">${{ m.paid_cents|money }}</td>
+                    <td class="p-2">${{ m.owed_cents|money }}</td>
+                    <td class="p-2">${{ m.settled_in_cents|money }}</td>
+                    <td class="p-2">${{ m.settled_out_cents|money }}</td>
+                </tr>
+            {% else %}
+                <tr><td class="p-2 text-slate-400" colspan="5">Nothing shared with {{ friend.name }} in {{ year }}.</td></tr>
+            {% endfor %}
+            </tbody>
+        </table>
+    </div>
+    {% endif %}
+</div>
+{% endblock %}
+"""
+
+GROUPS_TEMPLATE = """
+{% extends "layout.html" %}
+{% block content %}
+<div class="max-w-2xl mx-auto">
+    <div class="flex justify-between items-center mb-6">
+        <h2 class="text-2xl font-bold">Groups</h2>
+        <a href="{{ url_for('main.dashboard') }}" class="text-cyan-400 hover:text-cyan-300">&larr; Back to Dashboard</a>
+    </div>
+    {% if groups %}
+        <ul class="space-y-3 mb-8">
+            {% for g in groups %}
+            <li>
+                <a href="{{ url_for('main.group_detail', group_id=g.id) }}" class="bg-slate-800 hover:bg-slate-700 p-4 rounded-lg shadow-sm flex justify-between items-center gap-4">
+                    <span class="font-bold">{{ g.name }}</span>
+                    <span class="text-sm {% if g.net_cents > 0 %}text-green-400{% elif g.net_cents < 0 %}text-red-400{% else %}text-slate-400{% endif %}">
+                        {% if g.net_cents > 0 %}Owed ${{ g.net_cents|money }}{% elif g.net_cents < 0 %}You owe ${{ g.net_cents|abs|money }}{% else %}Settled{% endif %}
+                    </span>
+                </a>
+            </li>
+            {% endfor %}
+        </ul>
+    {% else %}
+        <p class="text-slate-400 mb-8">No groups yet. Make one for a trip or a shared household.</p>
+    {% endif %}
+    <form method="POST" action="{{ url_for('main.new_group') }}" class="bg-slate-800 p-6 rounded-lg space-y-4">
+        <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
+        <h3 class="text-xl font-bold">New Group</h3>
+        <input type="text" name="name" placeholder="Ski trip, Flat 4B..." maxlength="100" class="w-full bg-slate-700 text-white p-3 rounded-lg border border-slate-600" required>
+        <div class="max-h-40 overflow-y-auto space-y-2 p-3 bg-slate-900/50 rounded-lg border border-slate-700">
+            {% for friend in friends %}
+            <label class="flex items-center gap-3 p-2 rounded-md hover:bg-slate-700/50 cursor-pointer">
+                <input type="checkbox" name="member_ids" value="{{ friend.id }}" class="w-5 h-5 bg-slate-600 border-slate-500 rounded-sm text-cyan-500 focus:ring-cyan-600">
+                <span>{{ friend.name }}</span>
+            </label>
+            {% else %}
+            <p class="text-slate-400 text-center">You need to add friends first.</p>
+            {% endfor %}
+        </div>
+        <button type="submit" class="w-full bg-cyan-600 hover:bg-cyan-500 text-white font-bold py-3 px-4 rounded-lg">Create Group</button>
+    </form>
+</div>
+{% endblock %}
+"""
+
+GROUP_TEMPLATE = """
+{% extends "layout.html" %}
+{% block content %}
+<div class="max-w-3xl mx-auto">
+    <div class="flex justify-between items-center mb-6">
+        <h2 class="text-2xl font-bold">{{ group.name }}</h2>
+        <a href="{{ url_for('main.groups') }}" class="text-cyan-400 hover:text-cyan-300">&larr; All Groups</a>
+    </div>
+    <p class="text-slate-400 mb-4">{{ group.expense_count }} expenses, ${{ group.total_cents|money }} in total{% if group.settled_at %}. Last settled up {{ group.settled_at.strftime('%Y-%m-%d') }}{% endif %}.</p>
+    <div class="flex flex-wrap gap-3 mb-6">
+        <a href="{{ url_for('main.add_group_expense', group_id=group.id) }}" class="bg-cyan-600 hover:bg-cyan-500 text-white font-bold py-2 px-4 rounded-lg">Add Expense</a>
+        <a href="{{ url_for('main.export_group', group_id=group.id) }}" class="bg-slate-700 hover:bg-slate-600 text-slate-300 font-bold py-2 px-4 rounded-lg">Export CSV</a>
+    </div>
+    <div class="bg-slate-800 p-4 rounded-lg shadow-md mb-6 overflow-x-auto">
+        <table class="w-full text-sm text-left">
+            <thead class="text-slate-400">
+                <tr><th class="p-2">Member</th><th class="p-2">Paid</th><th class="p-2">Share</th><th class="p-2">Balance</th></tr>
+            </thead>
+            <tbody>
+            {% for m in members %}
+                <tr class="border-t border-slate-700">
+                    <td class="p-2">{{ m.name }}{% if m.username %} <span class="text-cyan-400">@{{ m.username }}</span>{% endif %}</td>
+                    <td class="p-2">${{ m.paid_cents|money }}</td>
+                    <td class="p-2">${{ m.share_cents|money }}</td>
+                    <td class="p-2 font-semibold {% if m.net_cents > 0 %}text-green-400{% elif m.net_cents < 0 %}text-red-400{% else %}text-slate-400{% endif %}">
+                        {% if m.net_cents > 0 %}Owed ${{ m.net_cents|money }}{% elif m.net_cents < 0 %}Owes ${{ m.net_cents|abs|money }}{% else %}Settled{% endif %}
+                    </td>
+                </tr>
+            {% endfor %}
+            </tbody>
+        </table>
+    </div>
+    {% if transfers %}
+    <div class="bg-slate-800 p-4 rounded-lg shadow-md mb-6">
+        <h3 class="text-xl font-semibold mb-2">To settle up</h3>
+        <ul class="space-y-1 mb-4">
+            {% for payer_id, payee_id, cents in transfers %}
+            <li>{{ names[payer_id] }} pays {{ names[payee_id] }} <span class="font-semibold">${{ cents|money }}</span></li>
+            {% endfor %}
+        </ul>
+        {% if transfers|selectattr(1, 'equalto', current_user.id)|list %}
+        <form method="POST" action="{{ url_for('main.settle_group', group_id=group.id) }}">
+            <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
+            <button type="submit" class="bg-green-600 hover:bg-green-500 text-white font-bold py-2 px-4 rounded-lg">Record Payments to Me</button>
+        </form>
+        {% else %}
+        <p class="text-sm text-slate-400">Each payment is recorded by the member who receives it.</p>
+        {% endif %}
+    </div>
+    {% endif %}
+    {% if addable %}
+    <form method="POST" action="{{ url_for('main.add_group_member', group_id=group.id) }}" class="flex gap-3 mb-6">
+        <select name="user_id" class="flex-1 bg-slate-700 text-white p-2 rounded-lg border border-slate-600">
+            {% for friend in addable %}<option value="{{ friend.id }}">{{ friend.name }}</option>{% endfor %}
+        </select>
+        <button type="submit" class="bg-slate-700 hover:bg-slate-600 text-slate-300 font-bold py-2 px-4 rounded-lg">Add Member</button>
+    </form>
+    {% endif %}
+    <h3 class="text-xl font-semibold mb-2">Recent Expenses</h3>
+    <ul class="space-y-3">
+        {% for exp in expenses %}
+        <li class="bg-slate-800 p-4 rounded-lg shadow-sm flex justify-between gap-4">
+            <div class="flex flex-col">
+                <span class="font-bold">{{ exp.description }}</span>
+                <span class="text-slate-400 text-sm">Paid by {{ names[exp.payer_id] }}{% if exp.created_at %} on {{ exp.created_at.strftime('%Y-%m-%d') }}{% endif %}</span>
+            </div>
+            <span class="font-semibold">${{ exp.total_cents|money }}</span>
+        </li>
+        {% else %}
+        <p class="text-slate-400">No expenses in this group yet.</p>
+        {% endfor %}
+    </ul>
+</div>
+{% endblock %}
+"""
+
 # --- Jinja Environment Setup ---
-jinja_env = Environment(loader=DictLoader({
+TEMPLATES = {
     'layout.html': LAYOUT_TEMPLATE,
     'login.html': LOGIN_TEMPLATE,
     'dashboard.html': DASHBOARD_TEMPLATE,
+    'dashboard_fragment.html': DASHBOARD_FRAGMENT_TEMPLATE,
     'friends.html': FRIENDS_TEMPLATE,
     'add_expense.html': ADD_EXPENSE_TEMPLATE,
     'settle.html': SETTLE_TEMPLATE,
     'index.html': HOME_PAGE_TEMPLATE,
-    'past_expenses.html': PAST_EXPENSES_TEMPLATE
-}))
-jinja_env.globals.update(url_for=url_for, get_flashed_messages=get_flashed_messages)
+    'past_expenses.html': PAST_EXPENSES_TEMPLATE,
+    'analytics.html': ANALYTICS_TEMPLATE,
+    'recurring.html': RECURRING_TEMPLATE,
+    'groups.html': GROUPS_TEMPLATE,
+    'group.html': GROUP_TEMPLATE
+}
+
+def get_jinja_env():
+    """Returns the app's Jinja environment, building it on the first render rather than at import."""
+    jinja_env = current_app.extensions.get('splittr_jinja')
+    if jinja_env is None:
+        jinja_env = Environment(loader=DictLoader(TEMPLATES))
+        jinja_env.globals.update(url_for=url_for, get_flashed_messages=get_flashed_messages,
+                                 new_idempotency_key=lambda: uuid.uuid4().hex, asset_url=asset_url)
+        jinja_env.filters['money'] = format_cents
+        jinja_env.filters['month_label'] = format_month
+        current_app.extensions['splittr_jinja'] = jinja_env
+    return jinja_env
+
+# Part of every dashboard ETag (with the asset manifest version), so a deploy that changes the markup or
+# the stylesheet never answers 304 with stale HTML
+DASHBOARD_MARKUP_HASH = hashlib.sha1((LAYOUT_TEMPLATE + DASHBOARD_TEMPLATE + DASHBOARD_FRAGMENT_TEMPLATE).encode()).hexdigest()[:12]
 
 def render_template(template_name, **context):
-    template = jinja_env.get_template(template_name)
+    template = get_jinja_env().get_template(template_name)
     if current_user.is_authenticated:
         context['current_user'] = current_user
     return template.render(context)
 
 # --- Routes --- 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
-    if current_user.is_authenticated: return redirect(url_for('dashboard'))
+    if current_user.is_authenticated: return redirect(url_for('main.dashboard'))
     if request.method == 'POST':
         user = User.query.filter_by(email=request.form['email']).first()
         if user and user.check_password(request.form['password']):
             login_user(user, remember=True)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         flash('Invalid phone number or password.', 'error')
     return render_template('login.html', form_type='login')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
-    if current_user.is_authenticated: return redirect(url_for('dashboard'))
+    if current_user.is_authenticated: return redirect(url_for('main.dashboard'))
     if request.method == 'POST':
         username = request.form.get('username')
         if User.query.filter_by(email=request.form['email']).first():
@@ -656,64 +1686,105 @@ def register():
             db.session.add(new_user)
             db.session.commit()
             flash('Account created successfully! Please log in.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
     return render_template('login.html', form_type='register')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-def calculate_balances():
-    friendships = Friendship.query.filter(or_(Friendship.user1_id == current_user.id, Friendship.user2_id == current_user.id)).all()
-    balances = {}
-    friend_map = {}
-    
-    for fs in friendships:
-        friend_id = fs.user2_id if fs.user1_id == current_user.id else fs.user1_id
-        friend = User.query.get(friend_id)
-        balances[friend] = 0
-        friend_map[friend.id] = friend
-    
-    my_debts_to_friends = db.session.query(Debt).join(Expense).filter(
-        Expense.payer_id.in_(friend_map.keys()),
-        Debt.debtor_id == current_user.id
-    ).all()
-    
-    debts_friends_owe_me = db.session.query(Debt).join(Expense).filter(
-        Expense.payer_id == current_user.id,
-        Debt.debtor_id.in_(friend_map.keys())
-    ).all()
-
-    for debt in my_debts_to_friends:
-        friend = friend_map[debt.expense.payer_id]
-        outstanding = debt.amount - debt.paid_amount
-        if outstanding > 0:
-            balances[friend] -= outstanding
-            
-    for debt in debts_friends_owe_me:
-        friend = friend_map[debt.debtor_id]
-        outstanding = debt.amount - debt.paid_amount
-        if outstanding > 0:
-            balances[friend] += outstanding
-            
-    return balances
-
-@app.route('/')
+def ledger_balances(user_id, friend_ids):
+    """Returns {friend_id: net cents} for user_id, positive when the friend owes user_id."""
+    if not friend_ids:
+        return {}
+    return {friend_id: int(total) for friend_id, total in db.session.execute(ledger_balances_stmt(user_id, friend_ids))}
+
+def calculate_balances(user_id, execute=None):
+    """Returns {friend: net cents} for every friend of user_id, positive when the friend owes user_id.
+
+    execute is used as in search_users, so /api/balances in asgi.py runs these same queries.
+    """
+    execute = execute or db.session.execute
+    friend_ids = execute(friend_ids_stmt(user_id)).scalars().all()
+    if not friend_ids:
+        return {}
+    friend_map = {u.id: u for u in execute(select(User).where(User.id.in_(friend_ids))).scalars()}
+    net = dict(execute(ledger_balances_stmt(user_id, friend_ids)).all())
+    return {friend_map[fid]: int(net.get(fid, 0)) for fid in friend_ids}
+
+def apply_payment(creditor_id, debtor_id, payment_cents):
+    """Applies a payment to the debtor's unpaid debts, oldest expense first.
+
+    A running SUM window over the outstanding amounts decides how much of the
+    payment lands on each debt, so no allocation arithmetic happens in Python.
+    """
+    outstanding = Debt.amount_cents - Debt.paid_cents
+    allocation = db.session.query(
+        Debt.id.label('debt_id'),
+        (func.sum(outstanding).over(order_by=(Debt.expense_id, Debt.id)) - outstanding).label('owed_before')
+    ).join(Expense).filter(
+        Expense.payer_id == creditor_id,
+        Expense.group_id.is_(None),
+        Debt.debtor_id == debtor_id,
+        Debt.is_fully_paid == False
+    ).subquery()
+    remaining = payment_cents - allocation.c.owed_before
+    applied = case((outstanding < remaining, outstanding), else_=remaining)
+
+    rows = db.session.query(Debt, applied).join(allocation, allocation.c.debt_id == Debt.id).filter(remaining > 0).all()
+    for debt, applied_cents in rows:
+        debt.paid_cents += applied_cents
+        debt.is_fully_paid = debt.paid_cents == debt.amount_cents
+
+@bp.route('/')
 def home():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     return render_template('index.html')
 
-@app.route('/dashboard')
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Serves a fingerprinted build output. Names change with content, so responses are cached for good."""
+    path = safe_join(current_app.config['ASSETS_DIR'], filename)
+    if path is None or filename == 'manifest.json' or filename.endswith(('.gz', '.br')) or not os.path.isfile(path):
+        abort(404)
+    mimetype = ASSET_TYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+    encoding = None
+    for name, suffix in ASSET_ENCODINGS:
+        if name in request.accept_encodings and os.path.isfile(path + suffix):
+            encoding, path = name, path + suffix
+            break
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['ASSETS_MAX_AGE']}, immutable"
+    return response
+
+@bp.route('/dashboard')
 @login_required
 def dashboard():
-    balances = calculate_balances()
-    request_count = FriendRequest.query.filter_by(receiver_id=current_user.id, status='pending').count()
-    return render_template('dashboard.html', balances=balances, request_count=request_count)
+    version = current_user.ledger_version
+    etag = f'{current_user.id}-{version}-{DASHBOARD_MARKUP_HASH}-{get_asset_manifest()[1]}'
+    # Pending flash messages are rendered into the page, so only a flash-free view can be a 304
+    if not session.get('_flashes') and etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        fragment = get_dashboard_fragment((current_user.id, version))
+        if fragment is None:
+            balances = calculate_balances(current_user.id)
+            request_count = FriendRequest.query.filter_by(receiver_id=current_user.id, status='pending').count()
+            groups_list = db.session.execute(user_groups_stmt(current_user.id)).all()
+            fragment = render_template('dashboard_fragment.html', balances=balances, request_count=request_count, groups=groups_list)
+            put_dashboard_fragment((current_user.id, version), fragment)
+        response = make_response(render_template('dashboard.html', fragment=fragment))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
-@app.route('/friends')
+@bp.route('/friends')
 @login_required
 def friends():
     pending_requests = FriendRequest.query.filter_by(receiver_id=current_user.id, status='pending').all()
@@ -722,7 +1793,7 @@ def friends():
     friend_list = [User.query.get(fs.user2_id if fs.user1_id == current_user.id else fs.user1_id) for fs in friendships]
     return render_template('friends.html', requests=requests_with_sender_info, friends=friend_list)
 
-@app.route('/send_request/<int:user_id>')
+@bp.route('/send_request/<int:user_id>')
 @login_required
 def send_request(user_id):
     found_user = User.query.get_or_404(user_id)
@@ -736,17 +1807,19 @@ def send_request(user_id):
         else:
             new_request = FriendRequest(sender_id=current_user.id, receiver_id=found_user.id)
             db.session.add(new_request)
+            bump_ledger_versions(current_user.id, found_user.id)
             db.session.commit()
+            invalidate_search_sessions(current_user.id, found_user.id)
             flash(f'Friend request sent to {found_user.name}.', 'success')
-    return redirect(url_for('friends'))
+    return redirect(url_for('main.friends'))
 
-@app.route('/handle_request/<int:request_id>/<action>')
+@bp.route('/handle_request/<int:request_id>/<action>')
 @login_required
 def handle_request(request_id, action):
     req = FriendRequest.query.get_or_404(request_id)
     if req.receiver_id != current_user.id:
         flash("You don't have permission for this request.", 'error')
-        return redirect(url_for('friends'))
+        return redirect(url_for('main.friends'))
 
     if action == 'accept':
         friendship = Friendship(user1_id=req.sender_id, user2_id=req.receiver_id)
@@ -755,96 +1828,89 @@ def handle_request(request_id, action):
     else:
         flash('Friend request declined.', 'info')
     
+    sender_id, receiver_id = req.sender_id, req.receiver_id
     db.session.delete(req)
+    bump_ledger_versions(sender_id, receiver_id)
     db.session.commit()
-    return redirect(url_for('friends'))
+    invalidate_search_sessions(sender_id, receiver_id)
+    return redirect(url_for('main.friends'))
 
-@app.route('/add_expense', methods=['GET', 'POST'])
+@bp.route('/add_expense', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def add_expense():
     friendships = Friendship.query.filter(or_(Friendship.user1_id == current_user.id, Friendship.user2_id == current_user.id)).all()
     friends_list = [User.query.get(fs.user2_id if fs.user1_id == current_user.id else fs.user1_id) for fs in friendships]
 
     if request.method == 'POST':
-        total_amount = float(request.form['total_amount'])
-        friend_ids = request.form.getlist('friend_ids')
-        split_method = request.form.get('split_method', 'even')
-
-        if not friend_ids:
-            flash('You must select at least one friend to split with.', 'error')
-            return redirect(url_for('add_expense'))
-
-        new_expense = Expense(description=request.form['description'], total_amount=total_amount, payer_id=current_user.id)
-        
-        if split_method == 'even':
-            amount_per_person = total_amount / (len(friend_ids) + 1)
-            for friend_id in friend_ids:
-                new_expense.debts.append(Debt(debtor_id=int(friend_id), amount=amount_per_person))
-        else:
-            total_custom_amount = 0
-            for friend_id in friend_ids:
-                amount_str = request.form.get(f'custom_amount_{friend_id}')
-                if amount_str:
-                    amount = float(amount_str)
-                    total_custom_amount += amount
-                    new_expense.debts.append(Debt(debtor_id=int(friend_id), amount=amount))
-            
-            if round(total_custom_amount, 2) > round(total_amount, 2):
-                flash('Custom amounts cannot add up to more than the total bill.', 'error')
-                return redirect(url_for('add_expense'))
+        try:
+            total_cents = to_cents(request.form['total_amount'])
+            shares = parse_split(request.form, total_cents)
+        except InvalidSplit as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.add_expense'))
+
+        new_expense = Expense(description=request.form['description'], total_cents=total_cents, payer_id=current_user.id, created_at=utcnow())
+        for friend_id, amount_cents in shares.items():
+            new_expense.debts.append(Debt(debtor_id=friend_id, amount_cents=amount_cents))
 
         db.session.add(new_expense)
+        deltas = new_rollup_deltas()
+        add_expense_deltas(deltas, current_user.id, month_key(new_expense.created_at), shares.items())
+        bump_rollups(deltas)
+        bump_ledger_versions(current_user.id, *(debt.debtor_id for debt in new_expense.debts))
         db.session.commit()
         flash('Expense added successfully!', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     return render_template('add_expense.html', friends=friends_list)
     
-@app.route('/settle/<int:friend_id>', methods=['GET', 'POST'])
+@bp.route('/settle/<int:friend_id>', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def settle(friend_id):
     friend = User.query.get_or_404(friend_id)
-    balances = calculate_balances()
-    balance = balances.get(friend, 0)
+    balance = ledger_balances(current_user.id, [friend.id]).get(friend.id, 0)
 
     if balance <= 0:
         flash(f"You don't have an outstanding balance to settle with {friend.name}.", 'info')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     if request.method == 'POST':
-        payment_amount = float(request.form['amount'])
-        if payment_amount <= 0 or payment_amount > balance + 0.005:
+        try:
+            payment_cents = to_cents(request.form['amount'])
+        except InvalidSplit as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.settle', friend_id=friend.id))
+
+        def record_payment():
+            # Re-read the balance on every attempt so a concurrent settlement can't be over-applied.
+            outstanding = ledger_balances(current_user.id, [friend.id]).get(friend.id, 0)
+            if payment_cents <= 0 or payment_cents > outstanding:
+                return False
+            apply_payment(current_user.id, friend.id, payment_cents)
+            settlement = Settlement(payer_id=friend.id, payee_id=current_user.id, amount_cents=payment_cents, created_at=utcnow())
+            db.session.add(settlement)
+            deltas = new_rollup_deltas()
+            add_settlement_deltas(deltas, friend.id, current_user.id, month_key(settlement.created_at), payment_cents)
+            bump_rollups(deltas)
+            bump_ledger_versions(current_user.id, friend.id)
+            return True
+
+        try:
+            recorded = commit_with_retry(record_payment)
+        except StaleDataError:
+            flash('This balance is being updated elsewhere. Please try again.', 'error')
+            return redirect(url_for('main.settle', friend_id=friend.id))
+        if not recorded:
             flash('Invalid settlement amount.', 'error')
-            return redirect(url_for('settle', friend_id=friend.id))
-        
-        # Get all unpaid debts this friend owes the current user, oldest first
-        unpaid_debts = db.session.query(Debt).join(Expense).filter(
-            Expense.payer_id == current_user.id,
-            Debt.debtor_id == friend.id,
-            Debt.is_fully_paid == False
-        ).order_by(Expense.id).all()
-
-        remaining_payment = payment_amount
-        for debt in unpaid_debts:
-            if remaining_payment <= 0:
-                break
-            
-            amount_owed = debt.amount - debt.paid_amount
-            payment_for_this_debt = min(remaining_payment, amount_owed)
-            
-            debt.paid_amount += payment_for_this_debt
-            remaining_payment -= payment_for_this_debt
-
-            if abs(debt.amount - debt.paid_amount) < 0.005:
-                debt.is_fully_paid = True
-        
-        db.session.commit()
-        flash(f"You've recorded a ${payment_amount:.2f} payment from {friend.name}.", 'success')
-        return redirect(url_for('dashboard'))
+            return redirect(url_for('main.settle', friend_id=friend.id))
+        flash(f"You've recorded a ${format_cents(payment_cents)} payment from {friend.name}.", 'success')
+        return redirect(url_for('main.dashboard'))
 
     return render_template('settle.html', friend=friend, balance=balance)
 
-@app.route('/past_expenses')
+@bp.route('/past_expenses')
 @login_required
 def past_expenses():
     # Expenses paid by the current user
@@ -853,27 +1919,448 @@ def past_expenses():
     owed_expenses = Debt.query.filter_by(debtor_id=current_user.id).join(Expense).order_by(Expense.id.desc()).all()
     return render_template('past_expenses.html', paid_expenses=paid_expenses, owed_expenses=owed_expenses)
 
+@bp.route('/recurring')
+@login_required
+def recurring():
+    templates = RecurringExpense.query.filter_by(payer_id=current_user.id).order_by(RecurringExpense.active.desc(), RecurringExpense.next_run_at).all()
+    return render_template('recurring.html', templates=templates)
+
+@bp.route('/recurring/new', methods=['GET', 'POST'])
+@login_required
+@idempotent
+def new_recurring():
+    if request.method == 'POST':
+        cadence = request.form.get('cadence', 'monthly')
+        try:
+            total_cents = to_cents(request.form['total_amount'])
+            shares = parse_split(request.form, total_cents)
+            if cadence not in CADENCES:
+                raise InvalidSplit('Please choose how often this expense repeats.')
+            try:
+                starts_on = date.fromisoformat(request.form.get('starts_on', ''))
+            except ValueError:
+                raise InvalidSplit('Please choose the date of the first charge.') from None
+            # Each past period is logged on the next tick, so only allow catching up on recent ones
+            if starts_on < utcnow().date() - timedelta(days=current_app.config['RECURRING_MAX_BACKDATE_DAYS']):
+                raise InvalidSplit(f"The first charge can't be more than {current_app.config['RECURRING_MAX_BACKDATE_DAYS']} days ago.")
+        except InvalidSplit as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.new_recurring'))
+
+        starts_at = datetime.combine(starts_on, datetime.min.time())
+        template = RecurringExpense(payer_id=current_user.id, description=request.form['description'], total_cents=total_cents,
+                                    split_method=request.form.get('split_method', 'even'), cadence=cadence,
+                                    starts_at=starts_at, next_run_at=starts_at)
+        for friend_id, amount_cents in shares.items():
+            template.participants.append(RecurringParticipant(debtor_id=friend_id, amount_cents=amount_cents))
+        db.session.add(template)
+        db.session.commit()
+        flash('Recurring expense created. It will be logged automatically on each due date.', 'success')
+        return redirect(url_for('main.recurring'))
+
+    friend_ids = db.session.execute(friend_ids_stmt(current_user.id)).scalars().all()
+    friends_list = User.query.filter(User.id.in_(friend_ids)).all() if friend_ids else []
+    return render_template('add_expense.html', friends=friends_list, recurring=True, today=utcnow().date().isoformat())
+
+@bp.route('/recurring/<int:recurring_id>/stop', methods=['POST'])
+@login_required
+def stop_recurring(recurring_id):
+    template = RecurringExpense.query.get_or_404(recurring_id)
+    if template.payer_id != current_user.id:
+        flash("You don't have permission to change this recurring expense.", 'error')
+    else:
+        template.active = False
+        db.session.commit()
+        flash(f'Stopped "{template.description}". Past charges are kept.', 'info')
+    return redirect(url_for('main.recurring'))
+
+def load_group(group_id):
+    """Returns (group, member positions) if the current user belongs to group_id, else (None, None).
+
+    The positions are the group's whole ledger: one row per member, however many expenses it has.
+    """
+    group = db.session.get(Group, group_id)
+    if group is None:
+        return None, None
+    members = db.session.execute(group_positions_stmt(group_id)).all()
+    if not any(m.user_id == current_user.id for m in members):
+        return None, None
+    return group, members
+
+@bp.route('/groups')
+@login_required
+def groups():
+    groups_list = db.session.execute(user_groups_stmt(current_user.id)).all()
+    friend_ids = db.session.execute(friend_ids_stmt(current_user.id)).scalars().all()
+    friends_list = User.query.filter(User.id.in_(friend_ids)).order_by(User.name).all() if friend_ids else []
+    return render_template('groups.html', groups=groups_list, friends=friends_list)
+
+@bp.route('/groups/new', methods=['POST'])
+@login_required
+@idempotent
+def new_group():
+    name = request.form.get('name', '').strip()[:100]
+    if not name:
+        flash('Please give the group a name.', 'error')
+        return redirect(url_for('main.groups'))
+
+    friend_ids = set(db.session.execute(friend_ids_stmt(current_user.id)).scalars())
+    member_ids = {current_user.id, *(i for i in request.form.getlist('member_ids', type=int) if i in friend_ids)}
+    group = Group(name=name, created_by_id=current_user.id, created_at=utcnow())
+    db.session.add(group)
+    db.session.flush()
+    db.session.add_all(GroupMember(group_id=group.id, user_id=user_id, joined_at=group.created_at) for user_id in member_ids)
+    bump_ledger_versions(*member_ids)
+    db.session.commit()
+    flash(f'Created {group.name}.', 'success')
+    return redirect(url_for('main.group_detail', group_id=group.id))
+
+@bp.route('/groups/<int:group_id>')
+@login_required
+def group_detail(group_id):
+    group, members = load_group(group_id)
+    if group is None:
+        flash("That group doesn't exist or you're not a member.", 'error')
+        return redirect(url_for('main.groups'))
+
+    names = {m.user_id: m.name for m in members}
+    transfers = settle_up_transfers((m.user_id, m.net_cents) for m in members)
+    expenses = Expense.query.filter_by(group_id=group.id).order_by(Expense.id.desc()).limit(current_app.config['GROUP_RECENT_EXPENSES']).all()
+    addable_ids = set(db.session.execute(friend_ids_stmt(current_user.id)).scalars()) - set(names)
+    addable = User.query.filter(User.id.in_(addable_ids)).order_by(User.name).all() if addable_ids else []
+    return render_template('group.html', group=group, members=members, names=names, transfers=transfers,
+                           expenses=expenses, addable=addable)
+
+@bp.route('/groups/<int:group_id>/members', methods=['POST'])
+@login_required
+def add_group_member(group_id):
+    group, members = load_group(group_id)
+    if group is None:
+        flash("That group doesn't exist or you're not a member.", 'error')
+        return redirect(url_for('main.groups'))
+
+    user_id = request.form.get('user_id', type=int)
+    friend_ids = set(db.session.execute(friend_ids_stmt(current_user.id)).scalars())
+    if user_id not in friend_ids:
+        flash('You can only add your friends to a group.', 'error')
+    elif any(m.user_id == user_id for m in members):
+        flash('They are already in this group.', 'info')
+    else:
+        db.session.add(GroupMember(group_id=group.id, user_id=user_id, joined_at=utcnow()))
+        bump_ledger_versions(user_id)
+        db.session.commit()
+        flash(f'{db.session.get(User, user_id).name} joined {group.name}.', 'success')
+    return redirect(url_for('main.group_detail', group_id=group.id))
+
+@bp.route('/groups/<int:group_id>/add_expense', methods=['GET', 'POST'])
+@login_required
+@idempotent
+def add_group_expense(group_id):
+    group, members = load_group(group_id)
+    if group is None:
+        flash("That group doesn't exist or you're not a member.", 'error')
+        return redirect(url_for('main.groups'))
+    other_ids = {m.user_id for m in members} - {current_user.id}
+
+    if request.method == 'POST':
+        try:
+            total_cents = to_cents(request.form['total_amount'])
+            shares = parse_split(request.form, total_cents)
+            if not other_ids.issuperset(shares):
+                raise InvalidSplit('You can only split with members of this group.')
+        except InvalidSplit as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.add_group_expense', group_id=group.id))
+
+        def record_expense():
+            expense = Expense(description=request.form['description'], total_cents=total_cents, payer_id=current_user.id,
+                              created_at=utcnow(), group_id=group.id)
+            for friend_id, amount_cents in shares.items():
+                expense.debts.append(Debt(debtor_id=friend_id, amount_cents=amount_cents))
+            db.session.add(expense)
+            group.total_cents += total_cents
+            group.expense_count += 1
+            positions = new_position_deltas()
+            add_group_expense_deltas(positions, current_user.id, total_cents, shares.items())
+            bump_group_positions(group.id, positions)
+            deltas = new_rollup_deltas()
+            add_expense_deltas(deltas, current_user.id, month_key(expense.created_at), shares.items())
+            bump_rollups(deltas)
+            bump_ledger_versions(current_user.id, *shares)
+
+        try:
+            commit_with_retry(record_expense)
+        except StaleDataError:
+            flash('This group is being updated elsewhere. Please try again.', 'error')
+            return redirect(url_for('main.add_group_expense', group_id=group.id))
+        flash(f'Expense added to {group.name}!', 'success')
+        return redirect(url_for('main.group_detail', group_id=group.id))
+
+    others = User.query.filter(User.id.in_(other_ids)).order_by(User.name).all() if other_ids else []
+    return render_template('add_expense.html', friends=others, group=group)
+
+@bp.route('/groups/<int:group_id>/settle', methods=['POST'])
+@login_required
+@idempotent
+def settle_group(group_id):
+    """Records the settle-up payments owed to the current user, bringing their position back to zero.
+
+    As with pairwise settling, only the person being paid can say a payment happened.
+    """
+    group, members = load_group(group_id)
+    if group is None:
+        flash("That group doesn't exist or you're not a member.", 'error')
+        return redirect(url_for('main.groups'))
+
+    def record_settle_up():
+        # Re-read the positions on every attempt; the Group version check catches writes that land after this read.
+        positions = db.session.execute(group_positions_stmt(group.id)).all()
+        transfers = settle_up_transfers((m.user_id, m.net_cents) for m in positions)
+        received = [t for t in transfers if t[1] == current_user.id]
+        if not received:
+            return 0, len(transfers)
+        now = utcnow()
+        db.session.add_all(Settlement(payer_id=payer_id, payee_id=payee_id, amount_cents=cents, created_at=now, group_id=group.id)
+                           for payer_id, payee_id, cents in received)
+        position_deltas, rollup_deltas = new_position_deltas(), new_rollup_deltas()
+        for payer_id, payee_id, cents in received:
+            add_group_settlement_deltas(position_deltas, payer_id, payee_id, cents)
+            add_settlement_deltas(rollup_deltas, payer_id, payee_id, month_key(now), cents)
+        bump_group_positions(group.id, position_deltas)
+        bump_rollups(rollup_deltas)
+        if len(received) == len(transfers):
+            group.settled_at = now
+        else:
+            # Nothing else on the Group row changes, but the write must still bump and check its version
+            flag_modified(group, 'settled_at')
+        bump_ledger_versions(*position_deltas)
+        return len(received), len(transfers) - len(received)
+
+    try:
+        recorded, remaining = commit_with_retry(record_settle_up)
+    except StaleDataError:
+        flash('This group is being updated elsewhere. Please try again.', 'error')
+        return redirect(url_for('main.group_detail', group_id=group.id))
+    if recorded:
+        flash(f'Recorded {recorded} payment{"s" if recorded != 1 else ""} to you.'
+              + (f' {group.name} is settled up.' if not remaining else ''), 'success')
+    elif remaining:
+        flash('Nobody in this group owes you money. Payments are recorded by the member who receives them.', 'info')
+    else:
+        flash(f'{group.name} is already settled up.', 'info')
+    return redirect(url_for('main.group_detail', group_id=group.id))
+
+@bp.route('/groups/<int:group_id>/export.csv')
+@login_required
+def export_group(group_id):
+    """Streams every expense of the group as CSV, one column per member holding their share."""
+    group, members = load_group(group_id)
+    if group is None:
+        flash("That group doesn't exist or you're not a member.", 'error')
+        return redirect(url_for('main.groups'))
+
+    names = {m.user_id: m.name for m in members}
+    stmt = select(Expense.id, Expense.created_at, Expense.description, Expense.payer_id, Expense.total_cents,
+                  Debt.debtor_id, Debt.amount_cents).outerjoin(Debt).where(Expense.group_id == group.id).order_by(Expense.id)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def drain():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return data
+
+        writer.writerow(['Date', 'Description', 'Paid by', 'Total', *(csv_cell(name) for name in names.values())])
+        rows = db.session.execute(stmt.execution_options(yield_per=current_app.config['GROUP_EXPORT_BATCH_SIZE']))
+        for _, expense_rows in groupby(rows, key=lambda row: row.id):
+            expense_rows = list(expense_rows)
+            first = expense_rows[0]
+            shares = {row.debtor_id: row.amount_cents for row in expense_rows if row.debtor_id is not None}
+            shares[first.payer_id] = first.total_cents - sum(shares.values())
+            writer.writerow([
+                first.created_at.strftime('%Y-%m-%d') if first.created_at else '',
+                csv_cell(first.description),
+                csv_cell(names.get(first.payer_id, '')),
+                format_cents(first.total_cents),
+                *(format_cents(shares[user_id]) if user_id in shares else '' for user_id in names),
+            ])
+            if buffer.tell() > 65536:
+                yield drain()
+        yield drain()
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="group-{group.id}.csv"'
+    return response
+
+@bp.route('/analytics')
+@login_required
+def analytics():
+    year = request.args.get('year', utcnow().year, type=int)
+    start, end = year * 100 + 1, year * 100 + 12
+    totals = db.session.execute(rollup_totals_stmt(current_user.id, start, end)).all()
+    friend_map = {u.id: u for u in User.query.filter(User.id.in_([t.friend_id for t in totals])).all()} if totals else {}
+    friend_totals = [(friend_map[t.friend_id], t) for t in totals]
+
+    friend = months = None
+    friend_id = request.args.get('friend_id', type=int)
+    if friend_id is not None:
+        # Only people the user shares a ledger with; any other id would reveal that user's name
+        friend = friend_map.get(friend_id)
+        if friend is None:
+            if friend_id not in db.session.execute(friend_ids_stmt(current_user.id)).scalars():
+                abort(404)
+            friend = db.session.get(User, friend_id)
+        months = db.session.execute(rollup_months_stmt(current_user.id, friend_id, start, end)).all()
+    return render_template('analytics.html', year=year, friend_totals=friend_totals, friend=friend, months=months)
+
 # --- API Routes ---
-@app.route('/api/search_users')
+@bp.route('/api/search_users')
 @login_required
 def api_search_users():
     query = request.args.get('q', '')
     if len(query) < 2:
         return jsonify([])
 
-    friend_ids = {f.user2_id if f.user1_id == current_user.id else f.user1_id for f in Friendship.query.filter(or_(Friendship.user1_id == current_user.id, Friendship.user2_id == current_user.id)).all()}
-    pending_request_ids = {r.sender_id if r.receiver_id == current_user.id else r.receiver_id for r in FriendRequest.query.filter(or_(FriendRequest.sender_id == current_user.id, FriendRequest.receiver_id == current_user.id)).all()}
-    
-    exclude_ids = friend_ids.union(pending_request_ids).union({current_user.id})
+    if not get_search_session(current_user.id).allow_search():
+        return jsonify({'error': 'Too many searches. Slow down a little.'}), 429, {'Retry-After': '1'}
+    return jsonify(search_users(current_user.id, query))
 
-    users = User.query.filter(
-        User.username.ilike(f'%{query}%'),
-        not_(User.id.in_(exclude_ids))
-    ).limit(10).all()
+@bp.route('/api/groups/<int:group_id>/summary')
+@login_required
+def api_group_summary(group_id):
+    """Group totals, every member's position and the payments that would settle the group up."""
+    group, members = load_group(group_id)
+    if group is None:
+        return jsonify({'error': 'Group not found.'}), 404
+    return jsonify({
+        'id': group.id,
+        'name': group.name,
+        'total_cents': group.total_cents,
+        'expense_count': group.expense_count,
+        'settled_at': group.settled_at.isoformat() if group.settled_at else None,
+        'members': [{'user_id': m.user_id, 'name': m.name, 'username': m.username, **{c: getattr(m, c) for c in GROUP_POSITION_COLUMNS}}
+                    for m in members],
+        'settle_up': [{'payer_id': payer_id, 'payee_id': payee_id, 'amount_cents': cents}
+                      for payer_id, payee_id, cents in settle_up_transfers((m.user_id, m.net_cents) for m in members)],
+    })
+
+@bp.route('/api/analytics')
+@login_required
+def api_analytics():
+    """Spending totals from the monthly rollups, for ?from=YYYY-MM&to=YYYY-MM (default: all time).
+
+    With ?friend_id= the response is that friend's month-by-month series, otherwise per-friend totals.
+    """
+    try:
+        start = parse_month(request.args['from']) if 'from' in request.args else 0
+        end = parse_month(request.args['to']) if 'to' in request.args else 999912
+    except ValueError:
+        return jsonify({'error': 'from and to must look like YYYY-MM.'}), 400
+
+    friend_id = request.args.get('friend_id', type=int)
+    if friend_id is not None:
+        rows = db.session.execute(rollup_months_stmt(current_user.id, friend_id, start, end)).all()
+        months = [{'month': format_month(r.month), **{c: getattr(r, c) for c in ROLLUP_COLUMNS}} for r in rows]
+        return jsonify({
+            'friend_id': friend_id,
+            'months': months,
+            'totals': {c: sum(m[c] for m in months) for c in ROLLUP_COLUMNS},
+        })
+
+    rows = db.session.execute(rollup_totals_stmt(current_user.id, start, end)).all()
+    return jsonify({'friends': [{'friend_id': r.friend_id, **{c: int(getattr(r, c)) for c in ROLLUP_COLUMNS}} for r in rows]})
+
+# --- Schema Migration ---
+
+def migrate_schema():
+    """Creates missing tables and adds columns and indexes introduced since the database was created.
+
+    Idempotent, so it can run on every deploy before the server starts. New
+    NOT NULL columns need a server_default for existing rows.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}'))
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Create or upgrade the database schema."""
+    migrate_schema()
+    click.echo('Database schema is up to date.')
+
+@click.command('materialize-recurring')
+@with_appcontext
+def materialize_recurring_command():
+    """Run one scheduler tick: log every recurring expense that is due."""
+    click.echo(f'Materialized {materialize_due_recurring()} recurring expenses.')
+
+@click.command('run-scheduler')
+@with_appcontext
+def run_scheduler_command():
+    """Materialize due recurring expenses every RECURRING_TICK_SECONDS until interrupted."""
+    while True:
+        # A failed tick (e.g. SQLite's "database is locked") is retried on the next one instead of stopping the loop
+        try:
+            created = materialize_due_recurring()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Recurring expense tick failed')
+        else:
+            if created:
+                click.echo(f'{utcnow().isoformat()} materialized {created} recurring expenses.')
+        db.session.remove()
+        time.sleep(current_app.config['RECURRING_TICK_SECONDS'])
+
+@click.command('backfill-rollups')
+@with_appcontext
+def backfill_rollups_command():
+    """Rebuild the monthly spending rollups from the full expense history."""
+    click.echo(f'Rebuilt {backfill_rollups()} rollup rows.')
+
+# --- App Factory ---
+
+def create_app(config=None):
+    """Builds a Splittr app. config is a mapping or object overriding Config.
+
+    No database work happens here; run `flask --app main migrate` once before serving.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
 
-    return jsonify([{'id': u.id, 'username': u.username, 'name': u.name} for u in users])
+    db.init_app(app)
+    load_asset_manifest(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(backfill_rollups_command)
+    app.cli.add_command(materialize_recurring_command)
+    app.cli.add_command(run_scheduler_command)
+    # Flask runs app-wide after_request hooks last-registered first, so putting this one at the front of the list
+    # makes it run after every other hook (Flask-Login's remember-cookie check included) and see all their session reads
+    app.after_request_funcs.setdefault(None, []).insert(0, forget_session_access)
+    return app
 
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
-        db.create_all()
-    app.run(debug=True, port=80, host='0.0.0.0') 
+        migrate_schema()
+    app.run(debug=True, port=80, host='0.0.0.0')
@@ -0,0 +1,66 @@
+import uuid
+
+import pytest
+
+from main import GroupMember, Group, User, create_app, db, migrate_schema
+
+
+@pytest.fixture
+def app():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TESTING': True})
+    with app.app_context():
+        migrate_schema()
+    return app
+
+
+@pytest.fixture
+def app_ctx(app):
+    """For tests that call helpers directly. Tests that make requests push contexts only around their own
+    database work, since a request reuses an active app context and with it Flask-Login's cached user."""
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client_for(app):
+    """Returns a test client logged in as the given user id."""
+    def make(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return make
+
+
+def add_user(username):
+    user = User(username=username, name=username.title(), email=f'{username}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def add_users(app, *usernames):
+    """Commits one user per name and returns their ids."""
+    with app.app_context():
+        ids = [add_user(username).id for username in usernames]
+        db.session.commit()
+    return ids
+
+
+def add_group(app, name, *member_ids):
+    """Commits a group created by the first member and returns its id."""
+    with app.app_context():
+        group = Group(name=name, created_by_id=member_ids[0])
+        db.session.add(group)
+        db.session.flush()
+        db.session.add_all(GroupMember(group_id=group.id, user_id=user_id) for user_id in member_ids)
+        db.session.commit()
+        return group.id
+
+
+def post(client, url, data=None):
+    """POSTs a form with a fresh idempotency key; returns (status, flashed messages)."""
+    response = client.post(url, data={**(data or {}), 'idempotency_key': uuid.uuid4().hex})
+    with client.session_transaction() as session:
+        return response.status_code, session.pop('_flashes', [])
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import asgi
+from conftest import add_users
+from main import Debt, Expense, Friendship, create_app, db, migrate_schema
+
+SLOW_ROUTE_SECONDS = 0.5
+
+# Registered at import, before any test sends the shared app its first request
+asgi.app.add_url_rule('/_test/slow', 'test_slow', lambda: time.sleep(SLOW_ROUTE_SECONDS) or 'done')
+
+
+@pytest.fixture
+def file_app(tmp_path, monkeypatch):
+    """Points asgi.py at a fresh app on an SQLite file, which its aiosqlite engine can open too."""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'splittr.db'}", 'TESTING': True})
+    with app.app_context():
+        migrate_schema()
+    monkeypatch.setattr(asgi, 'app', app)
+    for name in ('async_engine', 'async_session', 'watcher_task'):
+        monkeypatch.setattr(asgi, name, None)
+    return app
+
+
+def session_cookie(app, user_id):
+    value = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(user_id), '_fresh': True})
+    return (b'cookie', f"{app.config['SESSION_COOKIE_NAME']}={value}".encode())
+
+
+async def get(path, headers=()):
+    messages = []
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    path, _, query_string = path.partition('?')
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(), 'root_path': '',
+             'headers': list(headers),
+             'client': ('127.0.0.1', 50000), 'server': ('testserver', 80)}
+    await asgi.application(scope, receive, send)
+    status = next(m['status'] for m in messages if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return status, body
+
+
+def test_flask_routes_are_served_concurrently():
+    requests = 4
+
+    async def run():
+        return await asyncio.gather(*(get('/_test/slow') for _ in range(requests)))
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    assert responses == [(200, b'done')] * requests
+    # One at a time would take requests * SLOW_ROUTE_SECONDS
+    assert elapsed < 2 * SLOW_ROUTE_SECONDS
+
+
+def test_async_search_and_balances_endpoints(file_app):
+    alice, bob, carol, alfred, alma = add_users(file_app, 'alice', 'bob', 'carol', 'alfred', 'alma')
+    with file_app.app_context():
+        db.session.add_all([Friendship(user1_id=alice, user2_id=bob), Friendship(user1_id=carol, user2_id=alice)])
+        expense = Expense(description='Dinner', total_cents=3000, payer_id=alice)
+        expense.debts.append(Debt(debtor_id=bob, amount_cents=1000))
+        db.session.add(expense)
+        db.session.commit()
+    cookie = session_cookie(file_app, alice)
+
+    async def run():
+        try:
+            return await get('/api/search_users?q=al', [cookie]), await get('/api/balances', [cookie])
+        finally:
+            await asgi.async_engine.dispose()
+
+    (search_status, search_body), (balances_status, balances_body) = asyncio.run(run())
+    client = file_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(alice)
+
+    # Friends are excluded, and the Flask route is answered from the search session the async one filled
+    expected = [{'id': alfred, 'username': 'alfred', 'name': 'Alfred'}, {'id': alma, 'username': 'alma', 'name': 'Alma'}]
+    assert search_status == 200 and json.loads(search_body) == expected
+    assert client.get('/api/search_users?q=alf').get_json() == expected[:1]
+    assert balances_status == 200 and json.loads(balances_body) == [
+        {'id': bob, 'name': 'Bob', 'username': 'bob', 'balance_cents': 1000},
+        {'id': carol, 'name': 'Carol', 'username': 'carol', 'balance_cents': 0},
+    ]
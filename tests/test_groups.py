@@ -0,0 +1,40 @@
+from conftest import add_group, add_users, post
+from main import Group, Settlement, db, group_positions_stmt
+
+
+def positions(app, group_id):
+    with app.app_context():
+        return {m.user_id: m.net_cents for m in db.session.execute(group_positions_stmt(group_id))}
+
+
+def test_settle_up_only_records_payments_to_the_current_user(app, client_for):
+    alice, bob, carol = add_users(app, 'alice', 'bob', 'carol')
+    trip = add_group(app, 'Trip', alice, bob, carol)
+    post(client_for(alice), f'/groups/{trip}/add_expense', {'total_amount': '90', 'description': 'Hotel', 'friend_ids': [bob, carol]})
+    post(client_for(bob), f'/groups/{trip}/add_expense', {'total_amount': '90', 'description': 'Car', 'friend_ids': [alice, carol]})
+    assert positions(app, trip) == {alice: 3000, bob: 3000, carol: -6000}
+
+    # carol owes both of them and can't clear their receivables
+    status, flashes = post(client_for(carol), f'/groups/{trip}/settle')
+    assert status == 302 and flashes[0][0] == 'info'
+    assert positions(app, trip) == {alice: 3000, bob: 3000, carol: -6000}
+
+    post(client_for(alice), f'/groups/{trip}/settle')
+    assert positions(app, trip) == {alice: 0, bob: 3000, carol: -3000}
+    with app.app_context():
+        assert db.session.get(Group, trip).settled_at is None
+
+    post(client_for(bob), f'/groups/{trip}/settle')
+    assert positions(app, trip) == {alice: 0, bob: 0, carol: 0}
+    with app.app_context():
+        assert db.session.get(Group, trip).settled_at is not None
+        assert sorted((s.payer_id, s.payee_id, s.amount_cents) for s in Settlement.query) == [(carol, alice, 3000), (carol, bob, 3000)]
+
+
+def test_settle_up_button_only_shown_to_members_who_are_owed(app, client_for):
+    alice, bob = add_users(app, 'alice', 'bob')
+    trip = add_group(app, 'Trip', alice, bob)
+    post(client_for(alice), f'/groups/{trip}/add_expense', {'total_amount': '20', 'description': 'Taxi', 'friend_ids': [bob]})
+
+    assert 'Record Payments to Me' in client_for(alice).get(f'/groups/{trip}').get_data(as_text=True)
+    assert 'Record Payments to Me' not in client_for(bob).get(f'/groups/{trip}').get_data(as_text=True)
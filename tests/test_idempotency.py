@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.orm.exc import StaleDataError
+
+from conftest import add_users
+from main import Debt, Expense, Friendship, IdempotencyKey, commit_with_retry, db, utcnow
+
+
+@pytest.fixture
+def friends(app):
+    """alice and two friends, bob and carol, who each owe her $10; returns their ids."""
+    app.config['IDEMPOTENCY_WAIT_SECONDS'] = 0
+    alice, bob, carol = add_users(app, 'alice', 'bob', 'carol')
+    with app.app_context():
+        for friend in (bob, carol):
+            db.session.add(Friendship(user1_id=alice, user2_id=friend))
+            expense = Expense(description='Dinner', total_cents=2000, payer_id=alice)
+            expense.debts.append(Debt(debtor_id=friend, amount_cents=1000))
+            db.session.add(expense)
+        db.session.commit()
+    return alice, bob, carol
+
+
+def add_dinner(client, key, friend_id):
+    return client.post('/add_expense', data={'total_amount': '30', 'description': 'Lunch', 'friend_ids': friend_id,
+                                             'idempotency_key': key})
+
+
+def count(app, model):
+    with app.app_context():
+        return model.query.count()
+
+
+def test_a_retried_post_replays_the_stored_response(app, client_for, friends):
+    alice, bob, _ = friends
+    client = client_for(alice)
+
+    first = add_dinner(client, 'key-1', bob)
+    retry = add_dinner(client, 'key-1', bob)
+
+    assert first.status_code == retry.status_code == 302
+    assert retry.headers['Location'] == first.headers['Location']
+    assert count(app, Expense) == 3
+
+
+def test_a_duplicate_of_a_request_still_running_gets_409(app, client_for, friends):
+    alice, bob, _ = friends
+    with app.app_context():
+        db.session.add(IdempotencyKey(user_id=alice, key='key-1', endpoint='main.add_expense', path='/add_expense',
+                                      expires_at=utcnow() + timedelta(hours=1)))
+        db.session.commit()
+
+    response = add_dinner(client_for(alice), 'key-1', bob)
+
+    assert response.status_code == 409
+    assert count(app, Expense) == 2
+
+
+def test_an_expired_key_runs_the_request_again(app, client_for, friends):
+    alice, bob, _ = friends
+    client = client_for(alice)
+    add_dinner(client, 'key-1', bob)
+    with app.app_context():
+        IdempotencyKey.query.update({IdempotencyKey.expires_at: utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+    add_dinner(client, 'key-1', bob)
+
+    assert count(app, Expense) == 4
+
+
+def test_a_key_reused_on_another_endpoint_is_rejected(app, client_for, friends):
+    alice, bob, _ = friends
+    client = client_for(alice)
+    add_dinner(client, 'key-1', bob)
+
+    response = client.post(f'/settle/{bob}', data={'amount': '5', 'idempotency_key': 'key-1'})
+
+    assert response.status_code == 422
+    with app.app_context():
+        assert Debt.query.filter_by(debtor_id=bob).first().paid_cents == 0
+
+
+def test_a_key_reused_for_another_friend_is_rejected(app, client_for, friends):
+    alice, bob, carol = friends
+    client = client_for(alice)
+    assert client.post(f'/settle/{bob}', data={'amount': '5', 'idempotency_key': 'key-1'}).status_code == 302
+
+    response = client.post(f'/settle/{carol}', data={'amount': '5', 'idempotency_key': 'key-1'})
+
+    assert response.status_code == 422
+    with app.app_context():
+        assert Debt.query.filter_by(debtor_id=bob).first().paid_cents == 500
+        assert Debt.query.filter_by(debtor_id=carol).first().paid_cents == 0
+
+
+def test_commit_with_retry_reruns_after_a_lost_version_check(app_ctx):
+    calls = []
+
+    def operation():
+        calls.append(1)
+        if len(calls) == 1:
+            raise StaleDataError('lost the race')
+        return 'done'
+
+    assert commit_with_retry(operation) == 'done'
+    assert len(calls) == 2
+
+
+def test_commit_with_retry_gives_up_after_the_configured_attempts(app_ctx):
+    app_ctx.config['OPTIMISTIC_RETRY_ATTEMPTS'] = 3
+    calls = []
+
+    def operation():
+        calls.append(1)
+        raise StaleDataError('lost the race')
+
+    with pytest.raises(StaleDataError):
+        commit_with_retry(operation)
+    assert len(calls) == 3
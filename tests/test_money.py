@@ -0,0 +1,171 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from conftest import add_user, add_users, post
+from main import (Debt, Expense, Friendship, Group, InvalidSplit, allocate_cents, apply_payment, db, parse_split,
+                  settle_up_transfers, to_cents)
+
+
+def add_expense(payer, debtor, *amounts, group=None):
+    """One expense per amount, each owed in full by debtor; returns their debts oldest first."""
+    debts = []
+    for amount_cents in amounts:
+        expense = Expense(description='Test', total_cents=amount_cents, payer_id=payer.id, group_id=group and group.id)
+        debt = Debt(debtor_id=debtor.id, amount_cents=amount_cents)
+        expense.debts.append(debt)
+        db.session.add(expense)
+        debts.append(debt)
+    db.session.flush()
+    return debts
+
+
+# --- to_cents ---
+
+# to_cents only parses; parse_split and the settle route reject amounts that aren't positive
+@pytest.mark.parametrize('value, cents', [('12', 1200), ('12.5', 1250), (' 0.01 ', 1), ('0.005', 1), ('0.004', 0), ('-3.10', -310)])
+def test_to_cents(value, cents):
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '1,50', 'NaN', 'sNaN', 'Infinity', '-inf', '1e999999', '-1e99999999', '10000000000.01'])
+def test_to_cents_rejects_invalid_amounts(value):
+    with pytest.raises(InvalidSplit, match='Invalid amount'):
+        to_cents(value)
+
+
+# --- parse_split ---
+
+def split_form(custom=None):
+    """An expense form splitting with friends 2 and 3; custom maps friend id to amount for a custom split."""
+    return MultiDict([('friend_ids', '2'), ('friend_ids', '3'), ('split_method', 'custom' if custom else 'even')]
+                     + [(f'custom_amount_{friend_id}', amount) for friend_id, amount in (custom or {}).items()])
+
+
+def test_parse_split_even():
+    assert parse_split(split_form(), 1000) == {2: 333, 3: 333}
+
+
+def test_parse_split_custom():
+    assert parse_split(split_form({2: '2.50', 3: '0'}), 1000) == {2: 250, 3: 0}
+
+
+@pytest.mark.parametrize('total_cents', [0, -1000])
+@pytest.mark.parametrize('custom', [None, {2: '1'}])
+def test_parse_split_rejects_totals_that_are_not_positive(total_cents, custom):
+    with pytest.raises(InvalidSplit, match='more than zero'):
+        parse_split(split_form(custom), total_cents)
+
+
+def test_parse_split_rejects_negative_custom_shares():
+    # Summing to the total would otherwise hide a share larger than the bill
+    with pytest.raises(InvalidSplit, match='negative'):
+        parse_split(split_form({2: '50', 3: '-40'}), 1000)
+
+
+def test_parse_split_rejects_custom_shares_over_the_total():
+    with pytest.raises(InvalidSplit, match='more than the total'):
+        parse_split(split_form({2: '6', 3: '5'}), 1000)
+
+
+@pytest.mark.parametrize('total, custom', [('10', {'custom_amount_2': '50', 'custom_amount_3': '-40'}), ('-10', {}), ('0', {})])
+def test_add_expense_rejects_invalid_splits(app, client_for, total, custom):
+    alice, bob, carol = add_users(app, 'alice', 'bob', 'carol')
+    with app.app_context():
+        db.session.add_all([Friendship(user1_id=alice, user2_id=bob), Friendship(user1_id=alice, user2_id=carol)])
+        db.session.commit()
+
+    status, flashes = post(client_for(alice), '/add_expense', {
+        'total_amount': total, 'description': 'Dinner', 'friend_ids': [bob, carol],
+        'split_method': 'custom' if custom else 'even', **custom,
+    })
+
+    assert status == 302 and flashes[0][0] == 'error'
+    with app.app_context():
+        assert Expense.query.count() == 0 and Debt.query.count() == 0
+
+
+# --- allocate_cents ---
+
+def test_allocate_cents_even_split_gives_leftover_cents_to_first_shares():
+    assert allocate_cents(1000, [1, 1, 1]) == [334, 333, 333]
+    assert allocate_cents(101, [1, 1, 1, 1]) == [26, 25, 25, 25]
+
+
+def test_allocate_cents_largest_remainder_wins():
+    # Exact shares are 1/6, 2/6 and 3/6 of 100: 16.67, 33.33 and 50
+    assert allocate_cents(100, [1, 2, 3]) == [17, 33, 50]
+
+
+@pytest.mark.parametrize('total', [0, 1, 7, 999, 123457])
+@pytest.mark.parametrize('weights', [[1], [1, 1], [3, 1, 1], [5, 0, 2, 9], [1] * 11])
+def test_allocate_cents_always_sums_to_total(total, weights):
+    shares = allocate_cents(total, weights)
+    assert sum(shares) == total
+    assert all(abs(share * sum(weights) - total * w) < sum(weights) for share, w in zip(shares, weights))
+
+
+# --- apply_payment ---
+
+def test_apply_payment_pays_oldest_debts_first(app_ctx):
+    alice, bob = add_user('alice'), add_user('bob')
+    first, second, third = add_expense(alice, bob, 500, 300, 200)
+
+    apply_payment(alice.id, bob.id, 650)
+
+    assert [(d.paid_cents, d.is_fully_paid) for d in (first, second, third)] == [(500, True), (150, False), (0, False)]
+
+
+def test_apply_payment_continues_from_partially_paid_debts(app_ctx):
+    alice, bob = add_user('alice'), add_user('bob')
+    first, second = add_expense(alice, bob, 500, 300)
+    apply_payment(alice.id, bob.id, 200)
+
+    apply_payment(alice.id, bob.id, 400)
+
+    assert [(d.paid_cents, d.is_fully_paid) for d in (first, second)] == [(500, True), (100, False)]
+
+
+def test_apply_payment_only_touches_this_pairs_ledger(app_ctx):
+    alice, bob, carol = add_user('alice'), add_user('bob'), add_user('carol')
+    group = Group(name='Trip', created_by_id=alice.id)
+    db.session.add(group)
+    db.session.flush()
+    owed_to_carol, = add_expense(carol, bob, 400)
+    owed_in_group, = add_expense(alice, bob, 400, group=group)
+    owed_to_alice, = add_expense(alice, bob, 400)
+
+    apply_payment(alice.id, bob.id, 1000)
+
+    assert owed_to_alice.paid_cents == 400 and owed_to_alice.is_fully_paid
+    assert owed_to_carol.paid_cents == 0
+    assert owed_in_group.paid_cents == 0
+
+
+# --- settle_up_transfers ---
+
+def test_settle_up_transfers_clears_every_position():
+    positions = [(1, -700), (2, 300), (3, 500), (4, -100), (5, 0)]
+
+    transfers = settle_up_transfers(positions)
+
+    balances = dict(positions)
+    for payer_id, payee_id, cents in transfers:
+        assert cents > 0
+        balances[payer_id] += cents
+        balances[payee_id] -= cents
+    assert set(balances.values()) == {0}
+    assert len(transfers) <= len([net for _, net in positions if net]) - 1
+
+
+def test_settle_up_transfers_largest_debtor_pays_largest_creditor_first():
+    assert settle_up_transfers([(1, 1000), (2, -600), (3, -400)]) == [(2, 1, 600), (3, 1, 400)]
+    assert settle_up_transfers([(1, -900), (2, 200), (3, 700)]) == [(1, 3, 700), (1, 2, 200)]
+
+
+def test_settle_up_transfers_accepts_a_generator():
+    assert settle_up_transfers((user_id, net) for user_id, net in [(1, 50), (2, -50)]) == [(2, 1, 50)]
+
+
+def test_settle_up_transfers_nothing_to_settle():
+    assert settle_up_transfers([]) == []
+    assert settle_up_transfers([(1, 0), (2, 0)]) == []
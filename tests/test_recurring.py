@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from conftest import add_user
+from main import Debt, Expense, RecurringExpense, RecurringParticipant, db, materialize_due_recurring
+
+
+def add_template(cadence, starts_at, total_cents=3000):
+    """A recurring expense paid by a new user and split with two others."""
+    payer, bob, carol = add_user('payer'), add_user('bob'), add_user('carol')
+    template = RecurringExpense(payer_id=payer.id, description='Rent', total_cents=total_cents, cadence=cadence,
+                                starts_at=starts_at, next_run_at=starts_at)
+    template.participants = [RecurringParticipant(debtor_id=bob.id, amount_cents=1000),
+                             RecurringParticipant(debtor_id=carol.id, amount_cents=1000)]
+    db.session.add(template)
+    db.session.commit()
+    return template
+
+
+def periods(template):
+    return [e.period_at for e in Expense.query.filter_by(recurring_id=template.id).order_by(Expense.period_at)]
+
+
+def test_catches_up_missed_periods_with_month_end_clamping(app_ctx):
+    template = add_template('monthly', datetime(2028, 1, 31))
+
+    assert materialize_due_recurring(now=datetime(2028, 5, 15)) == 4
+
+    # Day 31 is clamped in short months, and February of a leap year ends on the 29th, without drifting later periods
+    assert periods(template) == [datetime(2028, 1, 31), datetime(2028, 2, 29), datetime(2028, 3, 31), datetime(2028, 4, 30)]
+    assert Debt.query.count() == 8
+    assert template.run_count == 4
+    assert template.next_run_at == datetime(2028, 5, 31)
+
+
+def test_a_second_tick_creates_nothing_new(app_ctx):
+    template = add_template('weekly', datetime(2026, 3, 2))
+    now = datetime(2026, 3, 20)
+
+    assert materialize_due_recurring(now=now) == 3
+    assert materialize_due_recurring(now=now) == 0
+
+    assert Expense.query.count() == 3 and Debt.query.count() == 6
+    assert template.run_count == 3
+    assert template.next_run_at == datetime(2026, 3, 23)
+
+
+def test_resumes_after_a_gap(app_ctx):
+    template = add_template('monthly', datetime(2026, 1, 31))
+
+    assert materialize_due_recurring(now=datetime(2026, 2, 1)) == 1
+    assert template.next_run_at == datetime(2026, 2, 28)
+    # The scheduler was down from February to June
+    assert materialize_due_recurring(now=datetime(2026, 6, 1)) == 4
+
+    assert periods(template) == [datetime(2026, 1, 31), datetime(2026, 2, 28), datetime(2026, 3, 31), datetime(2026, 4, 30),
+                                 datetime(2026, 5, 31)]
+    assert Debt.query.count() == 10
+    assert template.run_count == 5
+    assert template.next_run_at == datetime(2026, 6, 30)
+
+
+def test_a_period_already_written_by_a_concurrent_scheduler_is_not_duplicated(app_ctx):
+    template = add_template('weekly', datetime(2026, 3, 2))
+    # The other scheduler committed period 0 after this one read the template
+    db.session.add(Expense(description='Rent', total_cents=3000, payer_id=template.payer_id, created_at=template.starts_at,
+                           recurring_id=template.id, period_at=template.starts_at))
+    db.session.commit()
+
+    assert materialize_due_recurring(now=datetime(2026, 3, 10)) == 0
+
+    # The losing batch rolled back as a whole, so neither period 1 nor any debts were written
+    assert periods(template) == [datetime(2026, 3, 2)]
+    assert Debt.query.count() == 0
+    db.session.refresh(template)
+    assert template.run_count == 0
+
+
+def test_long_catch_ups_are_split_into_batches_within_one_tick(app_ctx):
+    app_ctx.config.update(RECURRING_MAX_CATCHUP=3, RECURRING_BATCH_SIZE=1)
+    template = add_template('weekly', datetime(2026, 1, 1))
+    other = RecurringExpense(payer_id=template.payer_id, description='Gym', total_cents=500, cadence='monthly',
+                             starts_at=datetime(2026, 1, 15), next_run_at=datetime(2026, 1, 15))
+    db.session.add(other)
+    db.session.commit()
+
+    # Weeks 0-10 of the first template and January-March of the second
+    assert materialize_due_recurring(now=datetime(2026, 3, 15)) == 14
+
+    assert len(periods(template)) == len(set(periods(template))) == 11
+    assert template.run_count == 11 and template.next_run_at == datetime(2026, 3, 19)
+    assert periods(other) == [datetime(2026, 1, 15), datetime(2026, 2, 15), datetime(2026, 3, 15)]
+    assert Debt.query.count() == 22
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+
+from conftest import add_group, add_users, post
+from main import (ROLLUP_COLUMNS, Expense, Friendship, GroupMember, RecurringExpense, RecurringParticipant, Settlement, SpendingRollup, backfill_rollups, db,
+                  materialize_due_recurring)
+
+
+@pytest.fixture
+def ledger(app, client_for):
+    """Runs pairwise expenses, settlements, a recurring expense, group expenses and group settle-ups through the app,
+    leaving a second group unsettled; returns (alice, bob, carol)."""
+    alice, bob, carol = add_users(app, 'alice', 'bob', 'carol')
+    with app.app_context():
+        db.session.add_all([Friendship(user1_id=alice, user2_id=bob), Friendship(user1_id=alice, user2_id=carol),
+                            Friendship(user1_id=bob, user2_id=carol)])
+        db.session.commit()
+    as_alice, as_bob, as_carol = client_for(alice), client_for(bob), client_for(carol)
+
+    post(as_alice, '/add_expense', {'total_amount': '100', 'description': 'Dinner', 'friend_ids': [bob, carol]})
+    post(as_bob, '/add_expense', {'total_amount': '45.50', 'description': 'Taxi', 'friend_ids': [alice, carol],
+                                  'split_method': 'custom', f'custom_amount_{alice}': '20', f'custom_amount_{carol}': '5.25'})
+    post(as_alice, f'/settle/{bob}', {'amount': '12.34'})
+    post(as_bob, f'/settle/{carol}', {'amount': '5.25'})
+    with app.app_context():
+        rent = RecurringExpense(payer_id=carol, description='Rent', total_cents=90000, cadence='monthly',
+                                starts_at=datetime(2026, 1, 31), next_run_at=datetime(2026, 1, 31))
+        rent.participants = [RecurringParticipant(debtor_id=alice, amount_cents=30000)]
+        db.session.add(rent)
+        db.session.commit()
+        materialize_due_recurring(now=datetime(2026, 4, 1))
+
+    trip = add_group(app, 'Trip', alice, bob, carol)
+    post(as_alice, f'/groups/{trip}/add_expense', {'total_amount': '300', 'description': 'Hotel', 'friend_ids': [bob, carol]})
+    post(as_bob, f'/groups/{trip}/add_expense', {'total_amount': '80', 'description': 'Fuel', 'friend_ids': [alice, carol],
+                                                 'split_method': 'custom', f'custom_amount_{alice}': '10', f'custom_amount_{carol}': '50'})
+    post(as_alice, f'/groups/{trip}/settle')
+    post(as_carol, f'/groups/{trip}/add_expense', {'total_amount': '33.33', 'description': 'Snacks', 'friend_ids': [alice, bob]})
+    post(as_carol, f'/groups/{trip}/settle')
+
+    flat = add_group(app, 'Flat', bob, carol)
+    post(as_bob, f'/groups/{flat}/add_expense', {'total_amount': '70.01', 'description': 'Internet', 'friend_ids': [carol]})
+    post(as_carol, f'/groups/{flat}/add_expense', {'total_amount': '12', 'description': 'Soap', 'friend_ids': [bob],
+                                                   'split_method': 'custom', f'custom_amount_{bob}': '12'})
+    return alice, bob, carol
+
+
+def rollup_rows():
+    rows = {}
+    for row in SpendingRollup.query:
+        values = tuple(getattr(row, c) for c in ROLLUP_COLUMNS)
+        if any(values):
+            rows[row.user_id, row.friend_id, row.month] = values
+    return rows
+
+
+def test_rollups_maintained_on_write_match_a_full_rebuild(app, ledger):
+    with app.app_context():
+        assert Settlement.query.count() == 6
+        maintained = rollup_rows()
+        backfill_rollups()
+        rebuilt = rollup_rows()
+
+    assert maintained
+    assert maintained == rebuilt
+
+
+def test_group_positions_kept_on_write_sum_to_zero_and_match_the_ledger(app, ledger):
+    expected = defaultdict(int)
+    with app.app_context():
+        for expense in Expense.query.filter(Expense.group_id.isnot(None)):
+            expected[expense.group_id, expense.payer_id] += expense.total_cents
+            for debt in expense.debts:
+                expected[expense.group_id, debt.debtor_id] -= debt.amount_cents
+            expected[expense.group_id, expense.payer_id] -= expense.total_cents - sum(d.amount_cents for d in expense.debts)
+        for settlement in Settlement.query.filter(Settlement.group_id.isnot(None)):
+            expected[settlement.group_id, settlement.payer_id] += settlement.amount_cents
+            expected[settlement.group_id, settlement.payee_id] -= settlement.amount_cents
+        members = GroupMember.query.all()
+
+    nets = defaultdict(int)
+    for member in members:
+        nets[member.group_id] += member.net_cents
+        assert member.net_cents == expected[member.group_id, member.user_id]
+    assert len(nets) == 2
+    assert all(net == 0 for net in nets.values())
+    assert any(member.net_cents for member in members)
+
+